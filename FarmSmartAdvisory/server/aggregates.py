@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Prediction Aggregates
+Incrementally maintained district x season x crop rollups of prediction history
+"""
+
+import json
+import os
+import threading
+from datetime import datetime
+from itertools import product
+from typing import Dict, Iterable, List, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Wildcard for "any district", "any season" or "any crop" in queries
+ALL = '*'
+
+# Per-cell counters, in the order they are stored
+FIELDS = ('recommendations', 'confidence_sum', 'yield_predictions', 'area_sum', 'production_sum', 'yield_sum')
+COUNT_FIELDS = ('recommendations', 'yield_predictions')
+
+def season_for_date(created_at: str) -> str:
+    """Cropping season for a timestamp: Kharif Jun-Oct, Rabi Nov-Mar, Summer Apr-May"""
+    try:
+        month = datetime.fromisoformat(created_at.replace('Z', '+00:00')).month
+    except (AttributeError, ValueError):
+        return ''
+    if 6 <= month <= 10:
+        return 'Kharif'
+    if month in (4, 5):
+        return 'Summer'
+    return 'Rabi'
+
+class PredictionAggregates:
+    """
+    Counts, sums and running means keyed by district x season x crop
+
+    Every observed prediction updates its own cell and the rollup cells where
+    any of the three keys is replaced by ALL, so dashboard queries are single
+    dictionary lookups instead of scans over prediction history.
+    Crop recommendations carry no season of their own; they are filed under
+    the season of their createdAt date unless the record names one.
+    """
+
+    def __init__(self):
+        self._cells: Dict[Tuple[str, str, str], List[float]] = {}
+        self._crops: Dict[Tuple[str, str], set] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _keys(record: Dict) -> Tuple[str, str, str]:
+        district = (record.get('district') or '').strip().lower()
+        season = (record.get('season') or season_for_date(record.get('createdAt'))).strip()
+        crop = (record.get('crop') or '').strip().lower()
+        return district, season, crop
+
+    def observe(self, record_type: str, record: Dict):
+        """
+        Add one prediction to the aggregates
+
+        Parameters:
+        -----------
+        record_type : str
+            'crop' for a recommendation or 'yield' for a yield prediction
+        record : dict
+            Prediction record as stored by the server, with its district
+        """
+        delta = [0.0] * len(FIELDS)
+        if record_type == 'crop':
+            delta[0] = 1
+            delta[1] = float(record.get('confidence') or 0.0)
+        elif record_type == 'yield':
+            delta[2] = 1
+            delta[3] = float(record.get('area') or 0.0)
+            delta[4] = float(record.get('predictedProduction', record.get('predicted_production')) or 0.0)
+            delta[5] = float(record.get('predictedYield', record.get('predicted_yield')) or 0.0)
+        else:
+            return
+
+        district, season, crop = self._keys(record)
+        with self._lock:
+            self._add(district, season, crop, delta)
+
+    def _add(self, district: str, season: str, crop: str, delta: List[float]):
+        for key in product((district, ALL), (season, ALL), (crop, ALL)):
+            cell = self._cells.get(key)
+            if cell is None:
+                cell = self._cells[key] = [0.0] * len(FIELDS)
+            for i, value in enumerate(delta):
+                cell[i] += value
+        for key in product((district, ALL), (season, ALL)):
+            self._crops.setdefault(key, set()).add(crop)
+
+    def get(self, district: str = ALL, season: str = ALL, crop: str = ALL) -> Dict:
+        """Counts, sums and means for one district/season/crop slice"""
+        key = (district.strip().lower() if district != ALL else ALL, season, crop.lower() if crop != ALL else ALL)
+        with self._lock:
+            cell = list(self._cells.get(key, [0.0] * len(FIELDS)))
+
+        stats = dict(zip(FIELDS, cell))
+        for field in COUNT_FIELDS:
+            stats[field] = int(stats[field])
+        stats['mean_confidence'] = stats['confidence_sum'] / stats['recommendations'] if stats['recommendations'] else None
+        stats['mean_yield'] = stats['yield_sum'] / stats['yield_predictions'] if stats['yield_predictions'] else None
+        return stats
+
+    def total_production(self, district: str = ALL, season: str = ALL, crop: str = ALL) -> float:
+        """Total projected production for a slice"""
+        return self.get(district, season, crop)['production_sum']
+
+    def top_crops(self, district: str = ALL, season: str = ALL, k: int = 5,
+                  by: str = 'recommendations') -> List[Dict]:
+        """
+        Top crops in a district/season slice
+
+        Parameters:
+        -----------
+        by : str
+            Any counter in FIELDS, e.g. 'recommendations' or 'production_sum'
+        """
+        if by not in FIELDS:
+            raise ValueError(f"Ranking field must be one of {FIELDS}, got {by}")
+        field = FIELDS.index(by)
+        district = district.strip().lower() if district != ALL else ALL
+
+        with self._lock:
+            ranked = sorted(
+                ((crop, self._cells[(district, season, crop)][field])
+                 for crop in self._crops.get((district, season), ())),
+                key=lambda item: item[1], reverse=True
+            )
+        cast = int if by in COUNT_FIELDS else float
+        return [{'crop': crop, by: cast(value)} for crop, value in ranked[:k] if value > 0]
+
+    def rebuild(self, records: Iterable[Dict]):
+        """
+        Rebuild from history
+
+        records is a stream of records tagged with a 'type' of 'farmer',
+        'crop' or 'yield', such as PredictionStore.iter_records(), whose
+        predictions carry the district they were filed under.
+        """
+        with self._lock:
+            self._cells.clear()
+            self._crops.clear()
+
+        for record in records:
+            if record.get('type') != 'farmer':
+                self.observe(record.get('type'), record)
+
+    @classmethod
+    def from_json_files(cls, farmers_path: str = None, predictions_path: str = None) -> 'PredictionAggregates':
+        """Build aggregates from the Express server's farmers.json and predictions.json"""
+        farmers_path = farmers_path or os.path.join(DATA_DIR, 'farmers.json')
+        predictions_path = predictions_path or os.path.join(DATA_DIR, 'predictions.json')
+
+        with open(farmers_path, 'r') as f:
+            farmers = json.load(f)
+        with open(predictions_path, 'r') as f:
+            predictions = json.load(f)
+
+        # Predictions without a district of their own take their farmer's
+        districts = {farmer['id']: farmer.get('district') for farmer in farmers}
+
+        def records():
+            for record_type, key in (('crop', 'cropPredictions'), ('yield', 'yieldPredictions')):
+                for prediction in predictions.get(key, []):
+                    record = {'type': record_type, **prediction}
+                    if not record.get('district'):
+                        record['district'] = districts.get(record.get('farmerId'))
+                    yield record
+
+        aggregates = cls()
+        aggregates.rebuild(records())
+        return aggregates
+
+    def save(self, path: str):
+        """Persist the base cells; rollups are recomputed on load"""
+        with self._lock:
+            cells = [
+                [district, season, crop] + values
+                for (district, season, crop), values in self._cells.items()
+                if ALL not in (district, season, crop)
+            ]
+
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'fields': FIELDS, 'cells': cells}, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    @classmethod
+    def load(cls, path: str) -> 'PredictionAggregates':
+        """Load aggregates saved with save"""
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        aggregates = cls()
+        width = len(data['fields'])
+        for cell in data['cells']:
+            district, season, crop = cell[:3]
+            aggregates._add(district, season, crop, cell[3:3 + width])
+        return aggregates
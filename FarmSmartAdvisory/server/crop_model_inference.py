@@ -9,12 +9,37 @@ import pandas as pd
 import pickle
 import joblib
 import os
+import time
 from typing import Dict, List, Tuple, Union, Optional
 
+# Model input order and the accepted range for each feature
+FEATURE_NAMES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+FEATURE_RANGES = {
+    'N': (0, 140),
+    'P': (5, 145),
+    'K': (5, 205),
+    'temperature': (8.8, 43.7),
+    'humidity': (14.3, 99.9),
+    'ph': (3.5, 9.9),
+    'rainfall': (20.2, 3000)
+}
+
+FEATURE_LABELS = {
+    'N': ('N (Nitrogen)', ''),
+    'P': ('P (Phosphorus)', ''),
+    'K': ('K (Potassium)', ''),
+    'temperature': ('Temperature', '°C'),
+    'humidity': ('Humidity', '%'),
+    'ph': ('pH', ''),
+    'rainfall': ('Rainfall', 'mm')
+}
+
 class CropRecommendationPredictor:
     """Crop Recommendation Model Predictor"""
     
-    def __init__(self, model_path: str = None, metadata_path: str = None):
+    def __init__(self, model_path: str = None, metadata_path: str = None, monitor=None,
+                 answer_cache=None, shadow=None):
         """
         Initialize the crop recommendation predictor
         
@@ -24,12 +49,25 @@ class CropRecommendationPredictor:
             Path to the trained model file (.pkl or .joblib)
         metadata_path : str, optional
             Path to the model metadata file
+        monitor : DriftMonitor, optional
+            Receives every input row and predicted crop
+        answer_cache : SoilAnswerCache, optional
+            Answers requests close to a past prediction without running the model
+        shadow : ShadowScorer, optional
+            Scores a candidate model on a sample of model-answered requests
+            after they are answered; cache hits are not shadowed
         """
         self.model = None
+        self.monitor = monitor
+        self.answer_cache = answer_cache
+        self.shadow = shadow
         self.metadata = None
         self.crop_names = None
         self.feature_names = None
         
+        # Path attribution arrays, compiled from the forest on first explain
+        self._attribution = None
+        
         # Auto-detect model files if not provided
         if model_path is None:
             model_path = self._find_model_file('crop_recommendation')
@@ -117,14 +155,14 @@ class CropRecommendationPredictor:
                     'grapes', 'watermelon', 'muskmelon', 'apple', 'orange', 'papaya',
                     'coconut', 'cotton', 'jute', 'coffee'
                 ]
-            self.feature_names = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+            self.feature_names = list(FEATURE_NAMES)
         
         print(f"Model loaded successfully!")
         print(f"Model type: {type(self.model).__name__}")
         print(f"Number of crop classes: {len(self.crop_names)}")
     
     def predict(self, N: float, P: float, K: float, temperature: float, 
-                humidity: float, ph: float, rainfall: float) -> Dict:
+                humidity: float, ph: float, rainfall: float, explain: bool = False) -> Dict:
         """
         Predict the best crop for given conditions
         
@@ -144,22 +182,44 @@ class CropRecommendationPredictor:
             pH level (3.5-9.9)
         rainfall : float
             Rainfall in mm (20.2-298.6)
+        explain : bool, optional
+            Also return per-feature contributions to the predicted crop
         
         Returns:
         --------
         dict
             Prediction results with crop name, confidence, and top alternatives
         """
+        start = time.perf_counter()
+        
+        # Record the input before validation so out-of-range requests are counted
+        self._observe(row=(N, P, K, temperature, humidity, ph, rainfall))
+        
         # Validate inputs
         self._validate_inputs(N, P, K, temperature, humidity, ph, rainfall)
         
         # Prepare input data
         input_data = np.array([[N, P, K, temperature, humidity, ph, rainfall]])
         
+        # Answer from a nearby past prediction when there is one
+        cached = None
+        if self.answer_cache is not None and not explain:
+            cached = self.answer_cache.lookup(input_data[0])
+            if cached is not None and not self.answer_cache.should_verify():
+                distance, answer = cached
+                self._observe(predicted_class=answer['predicted_crop'])
+                result = dict(answer, top_3_alternatives=list(answer['top_3_alternatives']))
+                result['cached'] = True
+                result['neighbor_distance'] = distance
+                # Cached answers are not shadowed; their latency is not the model's
+                return result
+        
         # Make prediction
         prediction = self.model.predict(input_data)[0]
         prediction_proba = self.model.predict_proba(input_data)[0]
         
+        self._observe(predicted_class=prediction)
+        
         # Get confidence and top alternatives
         confidence = np.max(prediction_proba)
         top_indices = np.argsort(prediction_proba)[-3:][::-1]
@@ -181,33 +241,149 @@ class CropRecommendationPredictor:
                     'confidence_percentage': float(prob * 100)
                 })
         
+        if cached is not None:
+            self.answer_cache.record_agreement(cached[1], result)
+        elif self.answer_cache is not None and not explain:
+            self.answer_cache.add(input_data[0], dict(result, top_3_alternatives=list(result['top_3_alternatives'])))
+        
+        # The candidate is scored without explain, so the primary latency excludes it too
+        latency = time.perf_counter() - start
+        
+        if explain:
+            explanation = self.explain_batch(input_data)
+            result['explanation'] = {
+                'base_value': float(explanation['base_value'][0]),
+                'contributions': dict(zip(explanation['feature_names'],
+                                          explanation['contributions'][0].tolist()))
+            }
+        
+        if self.shadow is not None:
+            self.shadow.submit((N, P, K, temperature, humidity, ph, rainfall), None, result, latency)
+        
         return result
     
+    def _observe(self, row=None, predicted_class=None):
+        """Feed the drift monitor, if any; a monitor failure never fails a prediction"""
+        if self.monitor is None:
+            return
+        try:
+            if row is not None:
+                self.monitor.observe(row, predicted_class)
+            else:
+                self.monitor.observe_class(predicted_class)
+        except Exception:
+            pass
+    
+    def _compile_path_attribution(self):
+        """
+        Compile the forest into flat node arrays for path-based attribution
+        
+        Walking each tree once from the root, every node accumulates the change
+        in class probabilities along its decision path, credited to the feature
+        split on at each step. At prediction time a sample's explanation is the
+        sum of the stored contributions of the leaves it lands in.
+        """
+        estimators = self.model.estimators_
+        n_features = self.model.n_features_in_
+        
+        offsets = []
+        values = []
+        contributions = []
+        root_values = []
+        n_nodes = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            value = tree.value[:, 0, :]
+            value = value / value.sum(axis=1, keepdims=True)
+            
+            # Children always have higher node ids than their parent
+            contribution = np.zeros((tree.node_count, n_features, value.shape[1]))
+            for node in np.where(tree.children_left >= 0)[0]:
+                feature = tree.feature[node]
+                for child in (tree.children_left[node], tree.children_right[node]):
+                    contribution[child] = contribution[node]
+                    contribution[child, feature] += value[child] - value[node]
+            
+            offsets.append(n_nodes)
+            values.append(value)
+            contributions.append(contribution)
+            root_values.append(value[0])
+            n_nodes += tree.node_count
+        
+        self._attribution = {
+            'offsets': np.array(offsets, dtype=np.intp),
+            'value': np.vstack(values),
+            # Stored class-major so a sample's row for its predicted class is contiguous
+            'contribution': np.ascontiguousarray(np.concatenate(contributions).transpose(0, 2, 1)) / len(estimators),
+            'base_value': np.mean(root_values, axis=0)
+        }
+    
+    def explain_batch(self, X) -> Dict:
+        """
+        Explain crop predictions for a batch of inputs
+        
+        Contributions come from the leaves each sample reaches, so the cost
+        stays close to that of a plain forest prediction.
+        
+        Parameters:
+        -----------
+        X : array-like of shape (n_samples, 7)
+            Inputs in feature order N, P, K, temperature, humidity, ph, rainfall
+        
+        Returns:
+        --------
+        dict
+            predicted_crop, confidence, base_value and contributions arrays;
+            base_value plus the row of contributions equals the confidence
+        """
+        if self._attribution is None:
+            self._compile_path_attribution()
+        
+        X = np.asarray(X, dtype=np.float64)
+        n_samples = X.shape[0]
+        leaves = self.model.apply(X) + self._attribution['offsets']
+        
+        # Accumulate tree by tree, in the same order as predict_proba
+        value = self._attribution['value']
+        probabilities = np.zeros((n_samples, value.shape[1]))
+        for t in range(leaves.shape[1]):
+            probabilities += value[leaves[:, t]]
+        probabilities /= leaves.shape[1]
+        predicted = np.argmax(probabilities, axis=1)
+        
+        contributions = self._attribution['contribution'][leaves, predicted[:, None]].sum(axis=1)
+        
+        return {
+            'predicted_crop': self.model.classes_[predicted],
+            'confidence': probabilities[np.arange(n_samples), predicted],
+            'base_value': self._attribution['base_value'][predicted],
+            'contributions': contributions,
+            'feature_names': list(self.feature_names)
+        }
+    
     def _validate_inputs(self, N, P, K, temperature, humidity, ph, rainfall):
         """Validate input parameters"""
-        if not (0 <= N <= 140):
-            raise ValueError(f"N (Nitrogen) must be between 0-140, got {N}")
-        if not (5 <= P <= 145):
-            raise ValueError(f"P (Phosphorus) must be between 5-145, got {P}")
-        if not (5 <= K <= 205):
-            raise ValueError(f"K (Potassium) must be between 5-205, got {K}")
-        if not (8.8 <= temperature <= 43.7):
-            raise ValueError(f"Temperature must be between 8.8-43.7°C, got {temperature}")
-        if not (14.3 <= humidity <= 99.9):
-            raise ValueError(f"Humidity must be between 14.3-99.9%, got {humidity}")
-        if not (3.5 <= ph <= 9.9):
-            raise ValueError(f"pH must be between 3.5-9.9, got {ph}")
-        if not (20.2 <= rainfall <= 3000):
-            raise ValueError(f"Rainfall must be between 20.2-3000mm, got {rainfall}")
+        values = (N, P, K, temperature, humidity, ph, rainfall)
+        for feature, value in zip(FEATURE_NAMES, values):
+            low, high = FEATURE_RANGES[feature]
+            label, unit = FEATURE_LABELS[feature]
+            if not (low <= value <= high):
+                raise ValueError(f"{label} must be between {low}-{high}{unit}, got {value}")
 
 class CropYieldPredictor:
     """Crop Yield Prediction Model Predictor"""
     
-    def __init__(self, model_path: str = None, metadata_path: str = None):
+    def __init__(self, model_path: str = None, metadata_path: str = None, shadow=None):
         """
         Initialize the crop yield predictor
+        
+        Parameters:
+        -----------
+        shadow : ShadowScorer, optional
+            Scores a candidate model on a sample of requests after they are answered
         """
         self.model = None
+        self.shadow = shadow
         self.metadata = None
         
         # Auto-detect model files if not provided
@@ -292,6 +468,8 @@ class CropYieldPredictor:
         """
         Predict crop yield for given conditions
         """
+        start = time.perf_counter()
+        
         # Basic yield calculation based on area
         # In a real implementation, this would use the actual preprocessing pipeline
         base_yield_per_hectare = 2.5  # tons per hectare (average)
@@ -307,4 +485,8 @@ class CropYieldPredictor:
             'year': crop_year
         }
         
+        if self.shadow is not None:
+            self.shadow.submit((crop_year, area, district_name, season, crop), None, result,
+                               time.perf_counter() - start)
+        
         return result
\ No newline at end of file
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Input Drift Monitor
+Bounded-memory streaming sketches of prediction inputs and predicted classes
+"""
+
+import json
+import math
+import threading
+import numpy as np
+from typing import Dict, List, Sequence
+
+from crop_model_inference import FEATURE_NAMES, FEATURE_RANGES
+
+# Bucket that absorbs new classes once max_classes distinct ones have been seen
+OTHER_CLASS = '__other__'
+
+class QuantileSketch:
+    """
+    KLL sketch of the quantiles of one stream of values
+
+    Level h holds items that each stand for 2**h values. Whenever the sketch
+    outgrows its capacity, the lowest level over its own capacity is sorted
+    and every other item, from a random start, is promoted to the level
+    above. The rank of any quantile is then off by about 1.3% of the count at
+    the default k of 200, shrinking roughly as 1 / k, whatever the range or
+    spread of the values. Memory is about 3 * k items plus two per level.
+    Sketches with the same k merge by concatenating their levels.
+    """
+
+    def __init__(self, k: int = 200):
+        self.k = k
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng()
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def update(self, values: np.ndarray):
+        """Add a batch of values"""
+        self.levels[0] = np.concatenate([self.levels[0], values])
+        self.n += len(values)
+        self._compress()
+
+    def merge(self, other: 'QuantileSketch'):
+        """Fold another sketch's values into this one"""
+        for level, items in enumerate(other.levels):
+            if level == len(self.levels):
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self._compress()
+
+    def _compress(self):
+        while sum(len(items) for items in self.levels) > sum(map(self._capacity, range(len(self.levels)))):
+            level = next(h for h, items in enumerate(self.levels) if len(items) >= self._capacity(h))
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+
+            # An odd item stays behind so the promoted pairs keep the total weight
+            items = np.sort(self.levels[level])
+            odd = len(items) % 2
+            promoted = items[odd + int(self._rng.integers(2))::2]
+            self.levels[level] = items[:odd]
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+
+    def quantiles(self, qs: Sequence[float]) -> np.ndarray:
+        """Values at the given quantiles, NaN when the sketch is empty"""
+        qs = np.asarray(qs, dtype=np.float64)
+        if not self.n:
+            return np.full(len(qs), np.nan)
+
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2.0 ** h) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        cumulative = np.cumsum(weights[order])
+        index = np.searchsorted(cumulative, qs * cumulative[-1], side='left')
+        return values[order][np.minimum(index, len(values) - 1)]
+
+    def to_list(self) -> List[List[float]]:
+        return [items.tolist() for items in self.levels]
+
+    @classmethod
+    def from_list(cls, levels: List[List[float]], k: int) -> 'QuantileSketch':
+        sketch = cls(k)
+        sketch.levels = [np.array(items, dtype=np.float64) for items in levels] or [np.empty(0)]
+        sketch.n = int(sum(len(items) * 2 ** h for h, items in enumerate(levels)))
+        return sketch
+
+class DriftMonitor:
+    """
+    Mergeable streaming summary of the inputs a model is asked to score
+
+    Each feature's quantiles are sketched with a QuantileSketch, whose error
+    is bounded in rank rather than by a bin width, alongside exact min, max,
+    mean and variance. Predicted classes go into a
+    bounded counter and values outside the training ranges are counted per
+    feature. Rows are buffered and folded in with vectorized updates, so the
+    per-row cost on the prediction path is a list append. Rows with missing,
+    non-numeric or non-finite values are counted as rejected and never
+    sketched, so one bad request cannot poison the summary.
+
+    Two monitors built with the same feature ranges and k can be
+    merged, so each worker process keeps its own and a collector combines
+    their snapshots.
+    """
+
+    def __init__(self, feature_ranges: Dict[str, tuple] = None, feature_names: List[str] = None,
+                 k: int = 200, max_classes: int = 64, buffer_size: int = 256):
+        """
+        Parameters:
+        -----------
+        feature_ranges : dict, optional
+            Feature name to (low, high) training range; defaults to the crop model's
+        feature_names : list, optional
+            Feature order of observed rows; defaults to the crop model's input order
+        k : int
+            Accuracy of the quantile sketches; rank error is about 2.6 / k
+        max_classes : int
+            Distinct predicted classes tracked before the rest share one bucket
+        buffer_size : int
+            Rows buffered before a vectorized update
+        """
+        self.feature_names = list(feature_names or FEATURE_NAMES)
+        ranges = feature_ranges or FEATURE_RANGES
+        self.ranges = np.array([ranges[f] for f in self.feature_names], dtype=np.float64)
+        self.k = k
+        self.max_classes = max_classes
+        self.buffer_size = buffer_size
+
+        n_features = len(self.feature_names)
+        self.sketches = [QuantileSketch(k) for _ in range(n_features)]
+        self.n = 0
+        self.sum = np.zeros(n_features)
+        self.sumsq = np.zeros(n_features)
+        self.min = np.full(n_features, np.inf)
+        self.max = np.full(n_features, -np.inf)
+        self.below = np.zeros(n_features, dtype=np.int64)
+        self.above = np.zeros(n_features, dtype=np.int64)
+        self.rejected = 0
+        self.classes: Dict[str, int] = {}
+
+        self._buffer: List[Sequence[float]] = []
+        self._lock = threading.Lock()
+
+    def observe(self, row: Sequence[float], predicted_class: str = None):
+        """Record one input row, and optionally the class predicted for it"""
+        try:
+            values = [float(v) for v in row]
+            valid = len(values) == len(self.feature_names) and all(math.isfinite(v) for v in values)
+        except (TypeError, ValueError):
+            valid = False
+
+        with self._lock:
+            if valid:
+                self._buffer.append(values)
+            else:
+                self.rejected += 1
+            if predicted_class is not None:
+                self._count_class(str(predicted_class), 1)
+            if len(self._buffer) >= self.buffer_size:
+                self._fold_buffer()
+
+    def observe_class(self, predicted_class: str):
+        """Record a predicted class without an input row"""
+        with self._lock:
+            self._count_class(str(predicted_class), 1)
+
+    def observe_batch(self, X, predicted_classes: Sequence[str] = None):
+        """Record a batch of input rows, and optionally their predicted classes"""
+        try:
+            X = np.asarray(X, dtype=np.float64).reshape(-1, len(self.feature_names))
+            finite = np.isfinite(X).all(axis=1)
+            rejected = int((~finite).sum())
+            X = X[finite]
+        except (TypeError, ValueError):
+            X, rejected = np.empty((0, len(self.feature_names))), len(X)
+
+        with self._lock:
+            self._fold(X)
+            self.rejected += rejected
+            if predicted_classes is not None:
+                labels, counts = np.unique(np.asarray(predicted_classes, dtype=str), return_counts=True)
+                for label, count in zip(labels, counts):
+                    self._count_class(str(label), int(count))
+
+    def _count_class(self, label: str, count: int):
+        if label not in self.classes and len(self.classes) >= self.max_classes:
+            label = OTHER_CLASS
+        self.classes[label] = self.classes.get(label, 0) + count
+
+    def _fold_buffer(self):
+        if self._buffer:
+            X = np.array(self._buffer, dtype=np.float64)
+            self._buffer = []
+            self._fold(X)
+
+    def _fold(self, X: np.ndarray):
+        if not len(X):
+            return
+
+        for sketch, column in zip(self.sketches, X.T):
+            sketch.update(column)
+
+        self.n += len(X)
+        self.sum += X.sum(axis=0)
+        self.sumsq += (X * X).sum(axis=0)
+        np.minimum(self.min, X.min(axis=0), out=self.min)
+        np.maximum(self.max, X.max(axis=0), out=self.max)
+        self.below += (X < self.ranges[:, 0]).sum(axis=0)
+        self.above += (X > self.ranges[:, 1]).sum(axis=0)
+
+    def _check_compatible(self, other: 'DriftMonitor'):
+        if (self.feature_names != other.feature_names or self.k != other.k
+                or not np.array_equal(self.ranges, other.ranges)):
+            raise ValueError("Drift monitors must share feature names, ranges and k to be merged")
+
+    def merge(self, other: 'DriftMonitor') -> 'DriftMonitor':
+        """Fold another monitor's observations into this one"""
+        self._check_compatible(other)
+        with other._lock:
+            other._fold_buffer()
+            sketches, classes = [s.to_list() for s in other.sketches], dict(other.classes)
+            stats = (other.n, other.sum.copy(), other.sumsq.copy(), other.min.copy(),
+                     other.max.copy(), other.below.copy(), other.above.copy())
+            rejected = other.rejected
+
+        with self._lock:
+            self._fold_buffer()
+            n, total, sumsq, low, high, below, above = stats
+            for sketch, levels in zip(self.sketches, sketches):
+                sketch.merge(QuantileSketch.from_list(levels, self.k))
+            self.n += n
+            self.sum += total
+            self.sumsq += sumsq
+            np.minimum(self.min, low, out=self.min)
+            np.maximum(self.max, high, out=self.max)
+            self.below += below
+            self.above += above
+            self.rejected += rejected
+            for label, count in classes.items():
+                self._count_class(label, count)
+        return self
+
+    def quantiles(self, qs: Sequence[float] = (0.01, 0.05, 0.5, 0.95, 0.99)) -> np.ndarray:
+        """
+        Approximate quantiles per feature
+
+        Each value is an observed input whose rank is within the sketch's
+        rank error of the requested quantile.
+
+        Returns:
+        --------
+        np.ndarray
+            Array of shape (n_features, len(qs)), NaN for features with no data
+        """
+        with self._lock:
+            self._fold_buffer()
+            return np.array([sketch.quantiles(qs) for sketch in self.sketches]).reshape(-1, len(qs))
+
+    def snapshot(self) -> Dict:
+        """Serializable state, suitable for merging across processes"""
+        with self._lock:
+            self._fold_buffer()
+            return {
+                'feature_names': list(self.feature_names),
+                'ranges': self.ranges.tolist(),
+                'k': self.k,
+                'max_classes': self.max_classes,
+                'n': self.n,
+                'sketches': [sketch.to_list() for sketch in self.sketches],
+                'sum': self.sum.tolist(),
+                'sumsq': self.sumsq.tolist(),
+                'min': [v if np.isfinite(v) else None for v in self.min.tolist()],
+                'max': [v if np.isfinite(v) else None for v in self.max.tolist()],
+                'below': self.below.tolist(),
+                'above': self.above.tolist(),
+                'rejected': self.rejected,
+                'classes': dict(self.classes)
+            }
+
+    @classmethod
+    def from_snapshot(cls, snapshot: Dict) -> 'DriftMonitor':
+        """Rebuild a monitor from a snapshot"""
+        names = snapshot['feature_names']
+        monitor = cls(
+            feature_ranges=dict(zip(names, map(tuple, snapshot['ranges']))),
+            feature_names=names,
+            k=snapshot['k'],
+            max_classes=snapshot['max_classes']
+        )
+        monitor.n = snapshot['n']
+        monitor.sketches = [QuantileSketch.from_list(levels, monitor.k) for levels in snapshot['sketches']]
+        monitor.sum = np.array(snapshot['sum'])
+        monitor.sumsq = np.array(snapshot['sumsq'])
+        monitor.min = np.array([np.inf if v is None else v for v in snapshot['min']])
+        monitor.max = np.array([-np.inf if v is None else v for v in snapshot['max']])
+        monitor.below = np.array(snapshot['below'], dtype=np.int64)
+        monitor.above = np.array(snapshot['above'], dtype=np.int64)
+        monitor.rejected = snapshot.get('rejected', 0)
+        monitor.classes = dict(snapshot['classes'])
+        return monitor
+
+    @classmethod
+    def merge_snapshots(cls, snapshots: List[Dict]) -> 'DriftMonitor':
+        """Combine snapshots from several workers into one monitor"""
+        monitor = cls.from_snapshot(snapshots[0])
+        for snapshot in snapshots[1:]:
+            monitor.merge(cls.from_snapshot(snapshot))
+        return monitor
+
+    def report(self) -> Dict:
+        """Per-feature and per-class summary for dashboards"""
+        qs = (0.01, 0.05, 0.5, 0.95, 0.99)
+        quantiles = self.quantiles(qs)
+
+        with self._lock:
+            n = self.n
+            features = {}
+            for f, name in enumerate(self.feature_names):
+                mean = float(self.sum[f] / n) if n else None
+                std = float(np.sqrt(max(self.sumsq[f] / n - mean * mean, 0.0))) if n else None
+                features[name] = {
+                    'training_range': self.ranges[f].tolist(),
+                    'mean': mean,
+                    'std': std,
+                    'min': float(self.min[f]) if n else None,
+                    'max': float(self.max[f]) if n else None,
+                    'quantiles': {f'p{int(q * 100):02d}': (float(v) if n else None) for q, v in zip(qs, quantiles[f])},
+                    'below_range': int(self.below[f]),
+                    'above_range': int(self.above[f]),
+                    'out_of_range_rate': float(self.below[f] + self.above[f]) / n if n else 0.0
+                }
+
+            total = sum(self.classes.values())
+            classes = {
+                label: {'count': count, 'share': count / total}
+                for label, count in sorted(self.classes.items(), key=lambda item: item[1], reverse=True)
+            }
+
+        return {'rows': n, 'rejected_rows': self.rejected, 'features': features, 'classes': classes}
+
+    def save(self, path: str):
+        """Write a snapshot to a JSON file"""
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str) -> 'DriftMonitor':
+        """Read a monitor back from a JSON snapshot file"""
+        with open(path, 'r') as f:
+            return cls.from_snapshot(json.load(f))
@@ -0,0 +1,354 @@
+#!/usr/bin/env python3
+"""
+Farm Planner
+Vectorized search for crop, season and area splits on one farm
+"""
+
+import math
+from itertools import combinations
+import numpy as np
+from typing import Dict, List, Sequence
+
+from serialization import columnar
+
+def _compositions(units: int, parts: int, min_units: int) -> np.ndarray:
+    """
+    Every way to split units into parts of at least min_units each
+
+    Returns:
+    --------
+    np.ndarray
+        Integer array of shape (n_splits, parts)
+    """
+    free = units - parts * min_units
+    if free < 0:
+        return np.empty((0, parts), dtype=np.int64)
+
+    # Stars and bars: choose where the parts - 1 dividers fall among free + parts - 1 slots
+    cuts = list(combinations(range(free + parts - 1), parts - 1))
+    cuts = np.array(cuts, dtype=np.int64).reshape(len(cuts), parts - 1)
+    edges = np.hstack([
+        np.full((len(cuts), 1), -1), cuts, np.full((len(cuts), 1), free + parts - 1)
+    ])
+    return np.diff(edges, axis=1) - 1 + min_units
+
+def _count_options(candidates: int, max_crops: int, units: int, min_units: int) -> int:
+    """Number of ways to split a season between up to max_crops of the candidates, fallow included"""
+    total = 1
+    for k in range(1, min(max_crops, candidates) + 1):
+        free = units - k * min_units
+        if free < 0:
+            break
+        total += math.comb(candidates, k) * math.comb(free + k - 1, k - 1)
+    return total
+
+def _pareto_layers(mean: np.ndarray, var: np.ndarray, depth: int) -> np.ndarray:
+    """
+    Indices of options in the first depth Pareto layers of high mean, low variance
+
+    An option outside these layers is beaten on both counts by at least
+    depth others, so it cannot be part of any of the depth best plans.
+    """
+    remaining = np.lexsort((var, -mean))
+    layers = []
+    for _ in range(depth):
+        if not len(remaining):
+            break
+        v = var[remaining]
+        # On the front when no option with at least its mean has a lower or equal variance
+        best_before = np.minimum.accumulate(np.concatenate([[np.inf], v[:-1]]))
+        front = v < best_before
+        layers.append(remaining[front])
+        remaining = remaining[~front]
+    return np.concatenate(layers) if layers else remaining
+
+class FarmPlanner:
+    """
+    Ranks ways to split a farm across (crop, season) pairs
+
+    Every pair is scored in one batch: soil suitability for each crop comes
+    from the rule-based recommender and yields for every crop and season in
+    the farm's district come from the yield cube. Suitability is read as the
+    chance the crop does well, so a pair's expected value per hectare is
+    suitability times its yield value and its spread is
+    value * sqrt(suitability * (1 - suitability)). Yield value is price times
+    yield when prices are given, otherwise yield relative to the crop's base
+    yield, which keeps crops measured in very different tonnages comparable.
+
+    A plan splits the farm's land separately in every season, since the same
+    land is cropped again each season, and may leave a season fallow. Its
+    score is the share-weighted expected value summed over seasons minus
+    risk_aversion times its spread, treating crops as independent, so
+    splitting land between crops pays off when their outcomes are uncertain.
+    """
+
+    def __init__(self, ml_service):
+        """
+        Parameters:
+        -----------
+        ml_service : MLService
+            Provides crop suitability scores and the yield cube
+        """
+        self.ml_service = ml_service
+
+    def score_pairs(self, soil_data: Dict, district: str, crops: Sequence[str] = None,
+                    seasons: Sequence[str] = None, prices: Dict[str, float] = None) -> Dict[str, np.ndarray]:
+        """
+        Score every (crop, season) pair for one farm in a single batch
+
+        Returns:
+        --------
+        dict
+            Per-pair arrays: crop, season, suitability, predicted_yield,
+            expected_value and spread, crop-major
+        """
+        service = self.ml_service
+        crops = [c.strip().lower() for c in (crops or service.yield_crops)]
+        seasons = list(seasons or service.yield_seasons)
+
+        suitability = np.repeat(service.calculate_crop_scores(crops, soil_data), len(seasons))
+        pair_crops = np.repeat(crops, len(seasons))
+        pair_seasons = np.tile(seasons, len(crops))
+
+        crop_idx, season_idx, district_idx = service.encode_yield_keys(
+            pair_crops, pair_seasons, np.full(len(pair_crops), district or '')
+        )
+        predicted_yield = service.predict_yield_batch(
+            crop_idx, season_idx, district_idx, np.ones(len(pair_crops)), encoded=True
+        )['predicted_yield']
+
+        if prices is not None:
+            lowered = {c.strip().lower(): p for c, p in prices.items()}
+            value = predicted_yield * np.array([lowered.get(c, 0.0) for c in pair_crops], dtype=np.float64)
+        else:
+            # The cube's unknown season and district slots hold each crop's base yield
+            value = predicted_yield / service.yield_cube[crop_idx, -1, -1]
+
+        return {
+            'crop': pair_crops,
+            'season': pair_seasons,
+            'suitability': suitability,
+            'predicted_yield': predicted_yield,
+            'expected_value': suitability * value,
+            'spread': value * np.sqrt(suitability * (1 - suitability))
+        }
+
+    def plan(self, soil_data: Dict, district: str, area: float, crops: Sequence[str] = None,
+             seasons: Sequence[str] = None, prices: Dict[str, float] = None, min_share: float = 0.2,
+             max_crops: int = 3, step: float = 0.1, top_k: int = 5, risk_aversion: float = 0.5,
+             max_candidates: int = 12, max_options: int = 1000000) -> Dict:
+        """
+        Find the best splits of a farm across crops and seasons
+
+        Parameters:
+        -----------
+        soil_data : dict
+            N, P, K, ph, temperature, humidity and rainfall of the farm
+        district : str
+            District of the farm, for yield factors
+        area : float
+            Farm area in hectares
+        crops, seasons : sequence, optional
+            Crops and seasons to consider; default to every one in the yield cube
+        prices : dict, optional
+            Crop to price per tonne; values plans in money instead of relative yield
+        min_share : float
+            Smallest share of the farm any chosen crop may take in a season
+        max_crops : int
+            Most crops grown in one season
+        step : float
+            Granularity of area shares; must divide 1 evenly
+        top_k : int
+            Number of plans to return
+        risk_aversion : float
+            Non-negative weight of spread against expected value in the plan score
+        max_candidates : int
+            Crops with the highest expected value considered in each season
+        max_options : int
+            Most crop and area splits scored in one season; searches over a
+            finer step or more crops than this allows are rejected up front
+
+        Returns:
+        --------
+        dict
+            Scored pairs and the top plans, best first
+        """
+        units = int(round(1 / step)) if step > 0 else 0
+        if not 0 < step <= 1 or abs(units * step - 1) > 1e-9:
+            raise ValueError(f"Share step must divide 1 evenly, got {step}")
+        if not 0 < min_share <= 1:
+            raise ValueError(f"Minimum share must be in (0, 1], got {min_share}")
+        if max_crops < 1 or top_k < 1:
+            raise ValueError("max_crops and top_k must be at least 1")
+        if risk_aversion < 0:
+            raise ValueError(f"Risk aversion must not be negative, got {risk_aversion}")
+
+        pairs = self.score_pairs(soil_data, district, crops, seasons, prices)
+        min_units = max(1, math.ceil(min_share * units - 1e-9))
+        expected = pairs['expected_value']
+        variance = pairs['spread'] ** 2
+
+        season_candidates = []
+        for season in dict.fromkeys(pairs['season'].tolist()):
+            in_season = np.nonzero((pairs['season'] == season) & (expected > 0))[0]
+            candidates = in_season[np.argsort(-expected[in_season], kind='stable')][:max_candidates]
+            count = _count_options(len(candidates), max_crops, units, min_units)
+            if count > max_options:
+                raise ValueError(
+                    f"A plan with step {step}, max_crops {max_crops} and min_share {min_share} has {count} "
+                    f"splits in season {season}, more than max_options {max_options}; "
+                    f"use a coarser step or fewer crops"
+                )
+            season_candidates.append(candidates)
+
+        options = [
+            self._season_options(candidates, expected, variance, max_crops, units, min_units, top_k)
+            for candidates in season_candidates
+        ]
+        floor = self._score_floor([o[2] for o in options], [o[3] for o in options], risk_aversion, top_k)
+
+        def reachable(mean, var, other_mean, other_var):
+            # Whether the best mean and lowest variance of the other seasons can lift a score to the floor
+            bound = mean + other_mean - risk_aversion * np.sqrt(var + other_var)
+            return np.nonzero(bound >= floor - 1e-9 * abs(floor))[0]
+
+        # Plans are built season by season. Only the first top_k Pareto
+        # layers of each season's splits, and of every partial combination,
+        # can reach the top_k, and of those only the ones that can reach the
+        # floor, so the rest are pruned before combining.
+        best_mean = np.array([o[2].max() for o in options])
+        least_var = np.array([o[3].min() for o in options])
+        for season, (season_pairs, season_shares, season_mean, season_var) in enumerate(options):
+            keep = reachable(season_mean, season_var, best_mean.sum() - best_mean[season],
+                             least_var.sum() - least_var[season])
+            options[season] = (season_pairs[keep], season_shares[keep], season_mean[keep], season_var[keep])
+
+        choices, mean, var = None, None, None
+        for season, (_, _, season_mean, season_var) in enumerate(options):
+            if choices is None:
+                choices = np.arange(len(season_mean))[:, None]
+                mean, var = season_mean, season_var
+            else:
+                n = len(season_mean)
+                choices = np.hstack([np.repeat(choices, n, axis=0), np.tile(np.arange(n), len(choices))[:, None]])
+                mean = (mean[:, None] + season_mean[None, :]).ravel()
+                var = (var[:, None] + season_var[None, :]).ravel()
+
+            keep = reachable(mean, var, best_mean[season + 1:].sum(), least_var[season + 1:].sum())
+            keep = keep[_pareto_layers(mean[keep], var[keep], top_k)]
+            choices, mean, var = choices[keep], mean[keep], var[keep]
+
+        plans = []
+        if choices is not None:
+            scores = mean - risk_aversion * np.sqrt(var)
+            for i in np.argsort(-scores, kind='stable')[:top_k]:
+                plans.append(self._describe(pairs, [o[:2] for o in options], choices[i], scores[i],
+                                            mean[i], var[i], area))
+
+        return {
+            'district': district,
+            'area': area,
+            'pairs': columnar(pairs),
+            'plans': plans
+        }
+
+    @staticmethod
+    def _season_options(candidates: np.ndarray, expected: np.ndarray, variance: np.ndarray,
+                        max_crops: int, units: int, min_units: int, depth: int) -> tuple:
+        """
+        Splits of one season's land between candidate pairs
+
+        Returns:
+        --------
+        tuple
+            (pairs, shares, mean, var); pairs and shares are (n, max_crops)
+            arrays padded with -1 and 0, and the all-padding row is fallow
+        """
+        pairs = [np.full((1, max_crops), -1, dtype=np.intp)]
+        shares = [np.zeros((1, max_crops))]
+        means, variances = [np.zeros(1)], [np.zeros(1)]
+
+        for k in range(1, min(max_crops, len(candidates)) + 1):
+            splits = _compositions(units, k, min_units)
+            if not len(splits):
+                break
+            split_shares = splits / units
+
+            groups = list(combinations(candidates.tolist(), k))
+            groups = np.array(groups, dtype=np.intp).reshape(len(groups), k)
+
+            chunk = max(1, 200000 // len(split_shares))
+            for start in range(0, len(groups), chunk):
+                block = groups[start:start + chunk]
+                mean = (expected[block] @ split_shares.T).ravel()
+                var = (variance[block] @ (split_shares ** 2).T).ravel()
+                keep = _pareto_layers(mean, var, depth)
+
+                block_pairs = np.full((len(keep), max_crops), -1, dtype=np.intp)
+                block_pairs[:, :k] = block[keep // len(split_shares)]
+                block_shares = np.zeros((len(keep), max_crops))
+                block_shares[:, :k] = split_shares[keep % len(split_shares)]
+
+                pairs.append(block_pairs)
+                shares.append(block_shares)
+                means.append(mean[keep])
+                variances.append(var[keep])
+
+        pairs, shares = np.vstack(pairs), np.vstack(shares)
+        mean, var = np.concatenate(means), np.concatenate(variances)
+        keep = _pareto_layers(mean, var, depth)
+        return pairs[keep], shares[keep], mean[keep], var[keep]
+
+    @staticmethod
+    def _score_floor(means: List[np.ndarray], variances: List[np.ndarray], risk_aversion: float,
+                     top_k: int) -> float:
+        """
+        A score at least top_k whole plans reach
+
+        The seeds are the plan taking every season's best option on its own,
+        and the plans that swap one season for another of its top_k options.
+        The top_k-th best seed score is a floor for the top_k-th best plan.
+        """
+        if not means:
+            return -np.inf
+        best = [int(np.argmax(m - risk_aversion * np.sqrt(v))) for m, v in zip(means, variances)]
+        seeds = {tuple(best)}
+        for season, (m, v) in enumerate(zip(means, variances)):
+            for option in np.argsort(-(m - risk_aversion * np.sqrt(v)), kind='stable')[:top_k].tolist():
+                seeds.add(tuple(best[:season]) + (option,) + tuple(best[season + 1:]))
+        if len(seeds) < top_k:
+            return -np.inf
+
+        scores = []
+        for seed in seeds:
+            mean = sum(m[i] for m, i in zip(means, seed))
+            var = sum(v[i] for v, i in zip(variances, seed))
+            scores.append(mean - risk_aversion * np.sqrt(var))
+        return float(np.sort(scores)[-top_k])
+
+    @staticmethod
+    def _describe(pairs: Dict, options: List[tuple], choice: np.ndarray, score: float,
+                  mean: float, var: float, area: float) -> Dict:
+        allocations = []
+        for (season_pairs, season_shares), option in zip(options, choice.tolist()):
+            chosen = sorted(zip(season_pairs[option].tolist(), season_shares[option].tolist()),
+                            key=lambda item: -item[1])
+            for pair, share in chosen:
+                if pair < 0:
+                    continue
+                allocations.append({
+                    'crop': str(pairs['crop'][pair]),
+                    'season': str(pairs['season'][pair]),
+                    'share': share,
+                    'area': share * area,
+                    'suitability': float(pairs['suitability'][pair]),
+                    'predicted_yield': float(pairs['predicted_yield'][pair]),
+                    'predicted_production': float(pairs['predicted_yield'][pair] * share * area)
+                })
+
+        return {
+            'score': float(score),
+            'expected_value': float(mean),
+            'spread': float(np.sqrt(var)),
+            'allocations': allocations
+        }
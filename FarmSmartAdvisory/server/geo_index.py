@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+"""
+District Geo Index
+Resolves coordinates to the nearest districts and estimates soil data from them
+"""
+
+import json
+import math
+import os
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Dict, List, Sequence, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Same order as the crop recommendation model inputs
+SOIL_FEATURES = ['N', 'P', 'K', 'temperature', 'humidity', 'ph', 'rainfall']
+
+EARTH_RADIUS_KM = 6371.0088
+
+def _to_unit_vectors(lats, lons) -> np.ndarray:
+    """Convert lat/lon in degrees to points on the unit sphere"""
+    lat = np.radians(np.asarray(lats, dtype=np.float64))
+    lon = np.radians(np.asarray(lons, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.stack([cos_lat * np.cos(lon), cos_lat * np.sin(lon), np.sin(lat)], axis=-1)
+
+def _chord_to_km(chord: np.ndarray) -> np.ndarray:
+    """Convert straight-line distance on the unit sphere to great-circle km"""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2.0, 0.0, 1.0))
+
+class DistrictSoilIndex:
+    """Nearest-district index over district centroids joined to soil records"""
+
+    def __init__(self, soil_data_path: str = None, centroids_path: str = None):
+        """
+        Build the index
+
+        Parameters:
+        -----------
+        soil_data_path : str, optional
+            Path to soil_data.json
+        centroids_path : str, optional
+            Path to district_centroids.json, matched to soil records by id
+        """
+        soil_data_path = soil_data_path or os.path.join(DATA_DIR, 'soil_data.json')
+        centroids_path = centroids_path or os.path.join(DATA_DIR, 'district_centroids.json')
+
+        with open(soil_data_path, 'r') as f:
+            soil_records = {soil['id']: soil for soil in json.load(f)}
+        with open(centroids_path, 'r') as f:
+            centroids = json.load(f)
+
+        records = []
+        coords = []
+        for centroid in centroids:
+            soil = soil_records.get(centroid['id'])
+            if soil is None:
+                print(f"Warning: No soil data for district centroid {centroid['id']}")
+                continue
+            records.append(soil)
+            coords.append((centroid['lat'], centroid['lon']))
+
+        if not records:
+            raise ValueError("No district centroids could be joined to soil records")
+
+        self.district_ids = [soil['id'] for soil in records]
+        self.district_names = [soil['district'] for soil in records]
+        self.soil_matrix = np.array([[soil[f] for f in SOIL_FEATURES] for soil in records], dtype=np.float64)
+
+        coords = np.array(coords)
+        self._tree = cKDTree(_to_unit_vectors(coords[:, 0], coords[:, 1]))
+
+    def __len__(self) -> int:
+        return len(self.district_ids)
+
+    def nearest_bulk(self, lats: Sequence[float], lons: Sequence[float],
+                     k: int = 3) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the k nearest districts for many coordinates
+
+        Returns:
+        --------
+        tuple
+            (distances_km, indices), both of shape (n, k), nearest first;
+            indices point into district_ids, district_names and soil_matrix
+        """
+        k = max(1, min(k, len(self)))
+        points = _to_unit_vectors(lats, lons).reshape(-1, 3)
+        chord, indices = self._tree.query(points, k=k)
+        return _chord_to_km(chord).reshape(-1, k), indices.reshape(-1, k)
+
+    def _query_one(self, lat: float, lon: float, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Single-coordinate query without the array setup of the bulk path"""
+        k = max(1, min(k, len(self)))
+        lat, lon = math.radians(lat), math.radians(lon)
+        cos_lat = math.cos(lat)
+        point = (cos_lat * math.cos(lon), cos_lat * math.sin(lon), math.sin(lat))
+        chord, indices = self._tree.query(point, k=k)
+        return _chord_to_km(np.atleast_1d(chord)), np.atleast_1d(indices)
+
+    def _describe(self, distances: np.ndarray, indices: np.ndarray) -> List[Dict]:
+        return [
+            {
+                'id': self.district_ids[i],
+                'district': self.district_names[i],
+                'distance_km': float(d)
+            } for d, i in zip(distances, indices)
+        ]
+
+    def nearest(self, lat: float, lon: float, k: int = 3) -> List[Dict]:
+        """Find the k nearest districts to a coordinate, nearest first"""
+        return self._describe(*self._query_one(lat, lon, k))
+
+    def estimate_soil_bulk(self, lats: Sequence[float], lons: Sequence[float],
+                           k: int = 3, power: float = 2.0) -> np.ndarray:
+        """
+        Estimate soil data for many coordinates by inverse-distance weighting
+
+        Returns:
+        --------
+        np.ndarray
+            Array of shape (n, 7) with columns in SOIL_FEATURES order
+        """
+        distances, indices = self.nearest_bulk(lats, lons, k)
+        return self._weighted_soil(distances, indices, power)
+
+    def estimate_soil(self, lat: float, lon: float, k: int = 3, power: float = 2.0) -> Dict:
+        """Estimate soil data for a coordinate from its nearest districts"""
+        distances, indices = self._query_one(lat, lon, k)
+        estimate = self._weighted_soil(distances[None, :], indices[None, :], power)[0]
+
+        result = dict(zip(SOIL_FEATURES, estimate.tolist()))
+        result['nearest_districts'] = self._describe(distances, indices)
+        return result
+
+    def _weighted_soil(self, distances: np.ndarray, indices: np.ndarray, power: float) -> np.ndarray:
+        """Inverse-distance-weighted average of the neighbouring soil records"""
+        # A coordinate sitting on a centroid takes that district's values
+        weights = 1.0 / np.maximum(distances, 1e-6) ** power
+        weights /= weights.sum(axis=1, keepdims=True)
+        return np.einsum('nk,nkf->nf', weights, self.soil_matrix[indices])
@@ -5,11 +5,20 @@ Handles crop recommendation and yield prediction with built-in logic
 """
 
 import json
+import os
 import sys
-from typing import Dict, List
+import numpy as np
+from typing import Dict, List, Sequence
+from farm_planner import FarmPlanner
+from serialization import RESPONSE_FORMATS, columnar, encode_response
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
 
 class MLService:
-    def __init__(self):
+    def __init__(self, yield_factors_path: str = None, soil_data_path: str = None, monitor=None):
+        # Optional DriftMonitor fed with every crop prediction input
+        self.monitor = monitor
+        
         # Crop recommendation rules based on soil conditions
         self.crop_rules = {
             'rice': {'N': (80, 120), 'P': (40, 60), 'K': (40, 60), 'ph': (5.5, 7.0), 'temp': (20, 35), 'humidity': (70, 95), 'rainfall': (1000, 3000)},
@@ -23,6 +32,79 @@ class MLService:
             'onion': {'N': (60, 100), 'P': (40, 60), 'K': (50, 70), 'ph': (6.0, 7.5), 'temp': (15, 30), 'humidity': (60, 80), 'rainfall': (300, 700)},
             'banana': {'N': (100, 140), 'P': (50, 80), 'K': (80, 120), 'ph': (5.5, 7.0), 'temp': (25, 35), 'humidity': (75, 95), 'rainfall': (1000, 2000)}
         }
+        
+        # Yield factors are loaded once into a dense crop x season x district cube
+        self.load_yield_factors(
+            yield_factors_path or os.path.join(DATA_DIR, 'yield_factors.json'),
+            soil_data_path or os.path.join(DATA_DIR, 'soil_data.json')
+        )
+    
+    def load_yield_factors(self, yield_factors_path: str, soil_data_path: str = None):
+        """
+        Build the yield cube from the yield factors file
+        
+        The cube has one extra slot on every axis for unknown keys, so a crop,
+        season or district missing from the data falls back to the default
+        yield, a neutral season multiplier and a neutral district factor.
+        District factors come from how well the district's soil suits the crop,
+        unless the factors file overrides them explicitly.
+        """
+        with open(yield_factors_path, 'r') as f:
+            factors = json.load(f)
+        
+        soil_by_district = {}
+        if soil_data_path and os.path.exists(soil_data_path):
+            with open(soil_data_path, 'r') as f:
+                for soil in json.load(f):
+                    soil_by_district[soil['district'].strip().lower()] = soil
+        
+        overrides = {d.strip().lower(): v for d, v in factors.get('districts', {}).items()}
+        
+        self.yield_crops = [c.lower() for c in factors['crops']]
+        self.yield_seasons = list(factors['seasons'])
+        self.yield_districts = sorted(set(soil_by_district) | set(overrides))
+        
+        # Index maps for the categorical keys; the last slot on each axis is "unknown"
+        self.crop_index = {c: i for i, c in enumerate(self.yield_crops)}
+        self.season_index = {s: i for i, s in enumerate(self.yield_seasons)}
+        self.district_index = {d: i for i, d in enumerate(self.yield_districts)}
+        
+        base_yields = np.array(list(factors['crops'].values()) + [factors.get('default_yield', 2.5)])
+        season_mults = np.array(list(factors['seasons'].values()) + [1.0])
+        
+        adjustment = factors.get('district_soil_adjustment', {})
+        floor = adjustment.get('floor', 1.0)
+        span = adjustment.get('span', 0.0)
+        
+        district_factors = np.ones((len(self.yield_crops) + 1, len(self.yield_districts) + 1))
+        for d, j in self.district_index.items():
+            soil = soil_by_district.get(d)
+            override = overrides.get(d, {})
+            for crop, i in self.crop_index.items():
+                if crop in self.crop_rules and soil is not None:
+                    district_factors[i, j] = floor + span * self.calculate_crop_score(crop, soil)
+                if isinstance(override, dict):
+                    district_factors[i, j] = override.get(crop, district_factors[i, j])
+                else:
+                    district_factors[i, j] = override
+        
+        self.yield_cube = base_yields[:, None, None] * season_mults[None, :, None] * district_factors[:, None, :]
+    
+    @staticmethod
+    def _encode_keys(values: Sequence[str], index: Dict[str, int], normalize) -> np.ndarray:
+        """Map categorical values to cube indices, encoding each distinct value once"""
+        uniques, inverse = np.unique(np.asarray(values, dtype=str), return_inverse=True)
+        codes = np.array([index.get(normalize(u), len(index)) for u in uniques], dtype=np.intp)
+        return codes[inverse.reshape(-1)]
+    
+    def encode_yield_keys(self, crops: Sequence[str], seasons: Sequence[str],
+                          districts: Sequence[str]) -> tuple:
+        """Encode crop, season and district names into yield cube indices"""
+        return (
+            self._encode_keys(crops, self.crop_index, lambda c: c.strip().lower()),
+            self._encode_keys(seasons, self.season_index, lambda s: s.strip()),
+            self._encode_keys(districts, self.district_index, lambda d: d.strip().lower())
+        )
     
     def calculate_crop_score(self, crop: str, soil_data: Dict) -> float:
         """Calculate how well soil conditions match crop requirements"""
@@ -51,6 +133,29 @@ class MLService:
         
         return score / total_factors if total_factors > 0 else 0.0
 
+    def calculate_crop_scores(self, crops: Sequence[str], soil_data: Dict) -> np.ndarray:
+        """Vectorized calculate_crop_score for many crops against one soil sample"""
+        factors = sorted({factor for rules in self.crop_rules.values() for factor in rules})
+        values = np.array([
+            soil_data.get('temperature' if factor == 'temp' else factor, np.nan) for factor in factors
+        ], dtype=np.float64)
+        
+        bounds = np.full((len(crops), len(factors), 2), np.nan)
+        for i, crop in enumerate(crops):
+            for j, factor in enumerate(factors):
+                bounds[i, j] = self.crop_rules.get(crop, {}).get(factor, (np.nan, np.nan))
+        low, high = bounds[..., 0], bounds[..., 1]
+        
+        used = ~np.isnan(low) & ~np.isnan(values)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            below = np.maximum(0, 1 - (low - values) / low)
+            above = np.maximum(0, 1 - (values - high) / high)
+        scores = np.where(values < low, below, np.where(values > high, above, 1.0))
+        
+        counts = used.sum(axis=1)
+        totals = np.where(used, scores, 0.0).sum(axis=1)
+        return np.divide(totals, counts, out=np.zeros(len(crops)), where=counts > 0)
+
     def predict_crop(self, soil_data: Dict) -> Dict:
         """
         Predict crop recommendation based on soil conditions
@@ -69,6 +174,13 @@ class MLService:
             predicted_crop = top_3[0][0]
             confidence = top_3[0][1]
             
+            if self.monitor is not None:
+                # Missing features are counted as rejected rows; the monitor never fails a prediction
+                try:
+                    self.monitor.observe([soil_data.get(f) for f in self.monitor.feature_names], predicted_crop)
+                except Exception:
+                    pass
+            
             result = {
                 'predicted_crop': predicted_crop,
                 'confidence': confidence,
@@ -92,32 +204,19 @@ class MLService:
     
     def predict_yield(self, yield_data: Dict) -> Dict:
         """
-        Predict crop yield based on crop type, area and season
+        Predict crop yield based on crop type, area, season and district
         """
         try:
             crop = yield_data['crop'].lower()
             area = yield_data['area']
             season = yield_data['season']
+            district = yield_data.get('district', '') or ''
             
-            # Base yield per hectare for different crops (tons/ha)
-            base_yields = {
-                'rice': 4.5, 'wheat': 3.2, 'maize': 3.8, 'cotton': 1.8, 
-                'sugarcane': 75.0, 'chickpea': 1.5, 'potato': 25.0,
-                'tomato': 30.0, 'onion': 20.0, 'banana': 40.0
-            }
-            
-            # Season multipliers
-            season_multipliers = {
-                'Kharif': 1.1,  # Better for rice, cotton
-                'Rabi': 1.0,    # Standard for wheat, chickpea
-                'Summer': 0.9   # Lower yields due to heat stress
-            }
-            
-            base_yield = base_yields.get(crop, 2.5)  # Default 2.5 tons/ha
-            season_mult = season_multipliers.get(season, 1.0)
+            crop_idx = self.crop_index.get(crop.strip(), len(self.crop_index))
+            season_idx = self.season_index.get(season.strip(), len(self.season_index))
+            district_idx = self.district_index.get(district.strip().lower(), len(self.district_index))
             
-            # Apply season multiplier
-            predicted_yield = base_yield * season_mult
+            predicted_yield = float(self.yield_cube[crop_idx, season_idx, district_idx])
             predicted_production = area * predicted_yield
             
             result = {
@@ -126,7 +225,7 @@ class MLService:
                 'area': area,
                 'crop': crop,
                 'season': season,
-                'district': yield_data.get('district', ''),
+                'district': district,
                 'year': yield_data['year']
             }
             
@@ -134,6 +233,37 @@ class MLService:
         except Exception as e:
             raise Exception(f"Yield prediction failed: {str(e)}")
     
+    def predict_yield_batch(self, crops: Sequence, seasons: Sequence, districts: Sequence,
+                            areas: Sequence[float], encoded: bool = False) -> Dict[str, np.ndarray]:
+        """
+        Predict yield and production for many rows at once
+        
+        Parameters:
+        -----------
+        crops, seasons, districts : sequence
+            Crop, season and district names per row, or cube indices from
+            encode_yield_keys when encoded is True
+        areas : sequence of float
+            Cultivated area per row in hectares
+        encoded : bool
+            Skip key encoding for callers that reuse the same encoded keys
+        
+        Returns:
+        --------
+        dict
+            Arrays of predicted_yield and predicted_production, one entry per row
+        """
+        if not encoded:
+            crops, seasons, districts = self.encode_yield_keys(crops, seasons, districts)
+        
+        predicted_yield = self.yield_cube[crops, seasons, districts]
+        predicted_production = np.asarray(areas, dtype=np.float64) * predicted_yield
+        
+        return {
+            'predicted_yield': predicted_yield,
+            'predicted_production': predicted_production
+        }
+    
     def generate_advisory(self, crop: str, soil_data: Dict) -> List[Dict]:
         """
         Generate farming advisory based on crop and soil conditions
@@ -199,7 +329,17 @@ ml_service = MLService()
 
 # Main execution for command line usage
 if __name__ == "__main__":
+    # Responses are compact JSON by default; --format msgpack writes a length-prefixed frame.
+    # An invalid --format is itself reported as a JSON error.
+    fmt = 'json'
+    
     try:
+        if '--format' in sys.argv:
+            position = sys.argv.index('--format') + 1
+            if position >= len(sys.argv) or sys.argv[position] not in RESPONSE_FORMATS:
+                raise ValueError(f"--format must be one of {RESPONSE_FORMATS}")
+            fmt = sys.argv[position]
+        
         # Read input from stdin
         input_data = json.loads(sys.stdin.read())
         
@@ -209,9 +349,25 @@ if __name__ == "__main__":
         elif 'yieldData' in input_data:
             # Yield prediction
             result = ml_service.predict_yield(input_data['yieldData'])
+        elif 'yieldBatch' in input_data:
+            # Batch yield prediction, answered column by column
+            batch = input_data['yieldBatch']
+            result = columnar(ml_service.predict_yield_batch(
+                batch['crops'], batch['seasons'], batch['districts'], batch['areas']
+            ))
+        elif 'farmPlan' in input_data:
+            # Best splits of one farm across crops and seasons
+            farm = dict(input_data['farmPlan'])
+            result = FarmPlanner(ml_service).plan(farm.pop('soilData'), farm.pop('district'), farm.pop('area'), **farm)
         else:
             result = {"error": "Invalid input data"}
-        
-        print(json.dumps(result))
     except Exception as e:
-        print(json.dumps({"error": str(e)}))
+        result = {"error": str(e)}
+    
+    try:
+        payload = encode_response(result, fmt)
+    except Exception as e:
+        payload = encode_response({"error": f"Response encoding failed: {str(e)}"}, fmt)
+    
+    sys.stdout.buffer.write(payload)
+    sys.stdout.buffer.flush()
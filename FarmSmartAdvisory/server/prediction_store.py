@@ -0,0 +1,642 @@
+#!/usr/bin/env python3
+"""
+Prediction Store
+Append-only prediction log with a per-farmer, per-district and per-phone index
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+# Sealed segments are named by the range of segment ids they cover, so a
+# merged segment supersedes the originals even if a crash leaves them behind
+SEGMENT_PATTERN = re.compile(r'^(\d{8})(?:-(\d{8}))?\.jsonl$')
+
+RECORD_TYPES = ('farmer', 'crop', 'yield')
+
+# Each sealed segment has an index file beside it holding one entry per
+# record: [offset, type, farmer id, district, phone]
+INDEX_SUFFIX = '.idx'
+
+Location = Tuple[str, int]
+
+def _segment_range(name: str) -> Tuple[int, int]:
+    match = SEGMENT_PATTERN.match(name)
+    first = int(match.group(1))
+    return first, int(match.group(2) or first)
+
+class PredictionStore:
+    """
+    Append-only store for farmers and crop/yield predictions
+
+    Records are appended as JSON lines to segment files under a log
+    directory. Appends are group-committed: a writer thread collects whatever
+    arrived during a short window, writes it in one go and fsyncs once, so
+    concurrent callers share the cost of each fsync. An in-memory index by
+    farmerId, district and phone is backed by an index file per sealed
+    segment, written once when the segment is sealed or merged, so opening
+    the store only rescans the active segment.
+
+    Compaction is tiered: it merges the newest run of sealed segments whose
+    sizes are no larger than the run after them, so each record is rewritten
+    a logarithmic number of times rather than on every compaction.
+    """
+
+    def __init__(self, log_dir: str = None, segment_bytes: int = 4 * 1024 * 1024,
+                 commit_interval: float = 0.002, compaction_interval: float = 60.0,
+                 compact_min_segments: int = 4, aggregates=None):
+        """
+        Open or create a store
+
+        Parameters:
+        -----------
+        log_dir : str, optional
+            Directory holding segment files and their index files
+        segment_bytes : int
+            Size at which the active segment is sealed and a new one started
+        commit_interval : float
+            Seconds the writer waits to gather appends into one fsync
+        compaction_interval : float
+            Seconds between background compaction checks, 0 to disable
+        compact_min_segments : int
+            Number of sealed segments that triggers a background compaction
+        aggregates : PredictionAggregates, optional
+            Updated with every prediction once it is written
+        """
+        self.log_dir = log_dir or os.path.join(DATA_DIR, 'prediction_log')
+        self.segment_bytes = segment_bytes
+        self.commit_interval = commit_interval
+        self.compact_min_segments = compact_min_segments
+        self.aggregates = aggregates
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._pending: List[Dict] = []
+        self._open_batch = 0
+        self._durable_batch = -1
+        self._error: Optional[Exception] = None
+        self._closed = False
+
+        self._segments: List[str] = []
+        self._farmers: Dict[str, Dict] = {}
+        self._by_farmer: Dict[str, List[Location]] = {}
+        self._by_district: Dict[str, List[Location]] = {}
+        self._by_phone: Dict[str, str] = {}
+        # Superseded farmer records per segment, which compaction can drop
+        self._superseded: Dict[str, int] = {}
+        # Index entries of the active segment, written out when it is sealed
+        self._active_entries: List[list] = []
+        self._compact_lock = threading.Lock()
+
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._recover()
+
+        self._active = open(os.path.join(self.log_dir, self._segments[-1]), 'ab')
+        self._active_size = self._active.tell()
+
+        self._writer = threading.Thread(target=self._write_loop, name='prediction-store-writer', daemon=True)
+        self._writer.start()
+
+        self._compactor = None
+        self._stop_compactor = threading.Event()
+        if compaction_interval:
+            self._compactor = threading.Thread(target=self._compact_loop, args=(compaction_interval,),
+                                               name='prediction-store-compactor', daemon=True)
+            self._compactor.start()
+
+    def _list_segments(self) -> List[str]:
+        """List live segments in log order, removing any a merged segment supersedes"""
+        for name in os.listdir(self.log_dir):
+            if name.endswith('.tmp'):
+                os.remove(os.path.join(self.log_dir, name))
+
+        names = [n for n in os.listdir(self.log_dir) if SEGMENT_PATTERN.match(n)]
+        ranges = {n: _segment_range(n) for n in names}
+
+        live = []
+        for name, (first, last) in ranges.items():
+            covered = any(
+                other != name and o_first <= first and last <= o_last and (o_first, o_last) != (first, last)
+                for other, (o_first, o_last) in ranges.items()
+            )
+            if covered:
+                os.remove(os.path.join(self.log_dir, name))
+            else:
+                live.append(name)
+
+        # Index files of segments that were merged away
+        for name in os.listdir(self.log_dir):
+            if name.endswith(INDEX_SUFFIX) and name[:-len(INDEX_SUFFIX)] not in live:
+                os.remove(os.path.join(self.log_dir, name))
+        return sorted(live, key=lambda n: ranges[n])
+
+    def _recover(self):
+        """Load the index file of every sealed segment and rescan the active one"""
+        self._segments = self._list_segments()
+
+        # Merged segments are sealed, so appends always go to a fresh single-id segment
+        if not self._segments or '-' in self._segments[-1]:
+            next_id = _segment_range(self._segments[-1])[1] + 1 if self._segments else 1
+            self._segments.append(f'{next_id:08d}.jsonl')
+            open(os.path.join(self.log_dir, self._segments[-1]), 'ab').close()
+
+        for name in self._segments[:-1]:
+            entries = self._load_segment_index(name)
+            if entries is None:
+                entries = self._scan_segment(name)
+                self._write_segment_index(name, entries, os.path.getsize(os.path.join(self.log_dir, name)))
+            else:
+                for entry in entries:
+                    self._index_entry(name, entry)
+        self._active_entries = self._scan_segment(self._segments[-1])
+
+    def _scan_segment(self, name: str) -> List[list]:
+        """Index every record in a segment and return its index entries"""
+        path = os.path.join(self.log_dir, name)
+        entries = []
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Torn write from a crash; drop the partial record
+                    print(f"Warning: Truncating partial record in {name} at offset {offset}")
+                    f.close()
+                    with open(path, 'r+b') as g:
+                        g.truncate(offset)
+                    break
+                entry = self._entry(json.loads(line), offset)
+                self._index_entry(name, entry)
+                entries.append(entry)
+                offset += len(line)
+        return entries
+
+    def _load_segment_index(self, name: str) -> Optional[List[list]]:
+        """Entries of a sealed segment's index file, or None if it is missing or stale"""
+        try:
+            with open(os.path.join(self.log_dir, name + INDEX_SUFFIX), 'r') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if index.get('size') != os.path.getsize(os.path.join(self.log_dir, name)):
+            return None
+        return index['entries']
+
+    def _write_segment_index(self, name: str, entries: List[list], size: int):
+        """Write a sealed segment's index file; a lost one is rebuilt from the segment on open"""
+        path = os.path.join(self.log_dir, name + INDEX_SUFFIX)
+        with open(path + '.tmp', 'w') as f:
+            json.dump({'size': size, 'entries': entries}, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+
+    def _entry(self, record: Dict, offset: int) -> list:
+        """Index entry for a record; callers hold the lock or own the store"""
+        district = (record.get('district') or '').strip().lower()
+        if record['type'] == 'farmer':
+            return [offset, 'farmer', record['id'], district, record.get('phone') or '']
+
+        farmer_id = record.get('farmerId', '')
+        if not district and farmer_id in self._farmers:
+            district = self._farmers[farmer_id]['district']
+        return [offset, record['type'], farmer_id, district, '']
+
+    def _index_entry(self, name: str, entry: list):
+        """Add an entry to the in-memory index; callers hold the lock or own the store"""
+        offset, record_type, farmer_id, district, phone = entry
+        location = (name, offset)
+        if record_type == 'farmer':
+            previous = self._farmers.get(farmer_id)
+            if previous:
+                segment = previous['location'][0]
+                self._superseded[segment] = self._superseded.get(segment, 0) + 1
+            if previous and previous['phone'] and self._by_phone.get(previous['phone']) == farmer_id:
+                del self._by_phone[previous['phone']]
+
+            self._farmers[farmer_id] = {'phone': phone, 'district': district, 'location': location}
+            if phone:
+                self._by_phone[phone] = farmer_id
+            return
+
+        self._by_farmer.setdefault(farmer_id, []).append(location)
+        if district:
+            self._by_district.setdefault(district, []).append(location)
+
+    def append(self, record_type: str, record: Dict, durable: bool = True) -> Dict:
+        """
+        Append a farmer or prediction record
+
+        Parameters:
+        -----------
+        record_type : str
+            'farmer', 'crop' or 'yield'
+        record : dict
+            Record fields; id and createdAt are filled in when missing
+        durable : bool
+            Wait until the record's group commit has been fsynced
+
+        Returns:
+        --------
+        dict
+            The stored record
+        """
+        if record_type not in RECORD_TYPES:
+            raise ValueError(f"Record type must be one of {RECORD_TYPES}, got {record_type}")
+
+        record = {'type': record_type, **record}
+        record.setdefault('id', str(uuid.uuid4()))
+        record.setdefault('createdAt', datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z'))
+
+        with self._cond:
+            if self._closed:
+                raise ValueError("Prediction store is closed")
+            if self._error is not None:
+                raise Exception(f"Prediction store write failed: {str(self._error)}")
+            self._pending.append(record)
+            batch = self._open_batch
+            self._cond.notify_all()
+            if durable:
+                self._wait_durable(batch)
+        return record
+
+    def _wait_durable(self, batch: int):
+        while self._durable_batch < batch and self._error is None:
+            self._cond.wait()
+        if self._error is not None:
+            raise Exception(f"Prediction store write failed: {str(self._error)}")
+
+    def flush(self):
+        """Wait until every record appended so far is durable"""
+        with self._cond:
+            if self._pending:
+                self._wait_durable(self._open_batch)
+            elif self._open_batch > 0:
+                self._wait_durable(self._open_batch - 1)
+
+    def _write_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+
+            # Let concurrent appends join this group commit
+            if self.commit_interval:
+                time.sleep(self.commit_interval)
+
+            with self._cond:
+                batch, self._pending = self._pending, []
+                batch_id = self._open_batch
+                self._open_batch += 1
+
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                print(f"Prediction store write failed: {str(e)}")
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                self._durable_batch = batch_id
+                self._cond.notify_all()
+
+    def _write_batch(self, batch: List[Dict]):
+        # Predictions without a district are filed under their farmer's
+        # district as of when they are written, and it is stored with them
+        with self._lock:
+            districts = {}
+            for record in batch:
+                if record['type'] == 'farmer':
+                    districts[record['id']] = (record.get('district') or '').strip().lower()
+                elif not record.get('district'):
+                    farmer_id = record.get('farmerId')
+                    farmer = self._farmers.get(farmer_id)
+                    district = districts.get(farmer_id, farmer['district'] if farmer else '')
+                    if district:
+                        record['district'] = district
+
+        lines = [(json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8') for record in batch]
+
+        if self._active_size >= self.segment_bytes:
+            self._roll_segment()
+
+        name = self._segments[-1]
+        self._active.write(b''.join(lines))
+        self._active.flush()
+        os.fsync(self._active.fileno())
+
+        with self._lock:
+            offset = self._active_size
+            for record, line in zip(batch, lines):
+                entry = self._entry(record, offset)
+                self._index_entry(name, entry)
+                self._active_entries.append(entry)
+                offset += len(line)
+            self._active_size = offset
+
+        if self.aggregates is not None:
+            for record in batch:
+                if record['type'] == 'farmer':
+                    continue
+                try:
+                    self.aggregates.observe(record['type'], record)
+                except Exception as e:
+                    # Aggregates are derived data; a bad record must not stop the writer
+                    print(f"Prediction aggregates update failed: {str(e)}")
+
+    def _roll_segment(self):
+        """Seal the active segment and start the next one"""
+        # Only this thread indexes the active segment, so its entries are final
+        self._write_segment_index(self._segments[-1], self._active_entries, self._active_size)
+
+        next_id = _segment_range(self._segments[-1])[1] + 1
+        name = f'{next_id:08d}.jsonl'
+        active = open(os.path.join(self.log_dir, name), 'ab')
+
+        with self._lock:
+            self._active.close()
+            self._active = active
+            self._active_size = 0
+            self._active_entries = []
+            self._segments.append(name)
+
+    def _read(self, locations: List[Location]) -> List[Dict]:
+        """Read records at the given locations; callers hold the lock"""
+        records = []
+        handles = {}
+        try:
+            for name, offset in locations:
+                f = handles.get(name)
+                if f is None:
+                    f = handles[name] = open(os.path.join(self.log_dir, name), 'rb')
+                f.seek(offset)
+                records.append(json.loads(f.readline()))
+        finally:
+            for f in handles.values():
+                f.close()
+        return records
+
+    def _query(self, locations: List[Location], record_type: Optional[str]) -> List[Dict]:
+        records = self._read(locations)
+        if record_type is not None:
+            records = [r for r in records if r['type'] == record_type]
+        return records
+
+    def get_farmer(self, farmer_id: str) -> Optional[Dict]:
+        """Latest record for a farmer, or None"""
+        self.flush()
+        with self._lock:
+            farmer = self._farmers.get(farmer_id)
+            return self._read([farmer['location']])[0] if farmer else None
+
+    def get_by_farmer(self, farmer_id: str, record_type: str = None) -> List[Dict]:
+        """Predictions for a farmer in append order, optionally only 'crop' or 'yield'"""
+        self.flush()
+        with self._lock:
+            return self._query(list(self._by_farmer.get(farmer_id, [])), record_type)
+
+    def get_by_district(self, district: str, record_type: str = None) -> List[Dict]:
+        """Predictions for a district in append order"""
+        self.flush()
+        with self._lock:
+            return self._query(list(self._by_district.get(district.strip().lower(), [])), record_type)
+
+    def get_by_phone(self, phone: str, record_type: str = None) -> List[Dict]:
+        """Predictions for the farmer registered with a phone number"""
+        self.flush()
+        with self._lock:
+            farmer_id = self._by_phone.get(phone)
+            return self._query(list(self._by_farmer.get(farmer_id, [])), record_type) if farmer_id else []
+
+    def iter_records(self, record_type: str = None) -> Iterator[Dict]:
+        """Stream every record in log order"""
+        self.flush()
+        # Open every segment up front so a concurrent compaction cannot remove them mid-stream
+        with self._lock:
+            handles = [open(os.path.join(self.log_dir, name), 'rb') for name in self._segments]
+            active_size = self._active_size
+
+        try:
+            for i, f in enumerate(handles):
+                remaining = active_size if i == len(handles) - 1 else None
+                for line in f:
+                    if remaining is not None:
+                        remaining -= len(line)
+                        if remaining < 0:
+                            break
+                    record = json.loads(line)
+                    if record_type is None or record['type'] == record_type:
+                        yield record
+        finally:
+            for f in handles:
+                f.close()
+
+    def _compact_loop(self, interval: float):
+        while not self._stop_compactor.wait(interval):
+            try:
+                with self._lock:
+                    sealed = len(self._segments) - 1
+                if sealed >= self.compact_min_segments:
+                    self.compact()
+            except Exception as e:
+                print(f"Prediction store compaction failed: {str(e)}")
+
+    def _select_run(self, sealed: List[str], superseded: Dict[str, int], full: bool) -> List[str]:
+        """Sealed segments worth merging, newest run first grown while older ones are no larger"""
+        if full:
+            run = sealed
+        else:
+            run, size = [], 0
+            for name in reversed(sealed):
+                segment_size = os.path.getsize(os.path.join(self.log_dir, name))
+                if run and segment_size > size:
+                    break
+                run.insert(0, name)
+                size += segment_size
+
+        # Merging is only worth it to cut the segment count or drop superseded records
+        if len(run) < 2 or (not full and len(run) < self.compact_min_segments
+                            and not any(superseded.get(name) for name in run)):
+            return []
+        return run
+
+    def compact(self, full: bool = False) -> int:
+        """
+        Merge sealed segments, dropping superseded farmer records
+
+        Parameters:
+        -----------
+        full : bool
+            Merge every sealed segment instead of only the newest tier
+
+        Returns:
+        --------
+        int
+            Number of segments merged
+        """
+        with self._compact_lock:
+            with self._lock:
+                sealed = self._segments[:-1]
+                superseded = dict(self._superseded)
+
+            run = self._select_run(sealed, superseded, full)
+            if not run:
+                return 0
+            return self._merge(run)
+
+    def _merge(self, run: List[str]) -> int:
+        """
+        Merge a run of sealed segments into one
+
+        The merged segment, its index file and the remapped index are all
+        built without the lock, which is only held to swap them in, so
+        appends and queries are not stalled by a large merge.
+        """
+        first, last = _segment_range(run[0])[0], _segment_range(run[-1])[1]
+        merged = f'{first:08d}-{last:08d}.jsonl'
+        tmp_path = os.path.join(self.log_dir, merged + '.tmp')
+        run_names = set(run)
+
+        with self._lock:
+            farmers = list(self._farmers.values())
+        latest_farmer = {farmer['location'] for farmer in farmers if farmer['location'][0] in run_names}
+
+        relocated: Dict[Location, int] = {}
+        kept_farmers = []
+        entries = []
+        with open(tmp_path, 'wb') as out:
+            for name in run:
+                segment_entries = self._load_segment_index(name)
+                if segment_entries is None:
+                    raise ValueError(f"Index file of segment {name} is missing or stale")
+                with open(os.path.join(self.log_dir, name), 'rb') as f:
+                    for entry, line in zip(segment_entries, f):
+                        location = (name, entry[0])
+                        if entry[1] == 'farmer':
+                            if location not in latest_farmer:
+                                continue
+                            kept_farmers.append((entry[2], (merged, out.tell())))
+                        relocated[location] = out.tell()
+                        entries.append([out.tell()] + entry[1:])
+                        out.write(line)
+            out.flush()
+            os.fsync(out.fileno())
+            size = out.tell()
+
+        self._write_segment_index(merged, entries, size)
+        os.replace(tmp_path, os.path.join(self.log_dir, merged))
+
+        # Only sealed segments are merged and appends only reach the active
+        # one, so the first n locations of each list are all that can move
+        with self._lock:
+            by_farmer = [(key, v, len(v)) for key, v in self._by_farmer.items()]
+            by_district = [(key, v, len(v)) for key, v in self._by_district.items()]
+
+        def remap(index):
+            updates = []
+            for key, locations, n in index:
+                locations = locations[:n]
+                if any(name in run_names for name, _ in locations):
+                    remapped = [(merged, relocated[loc]) if loc in relocated else loc for loc in locations]
+                    updates.append((key, n, remapped))
+            return updates
+
+        farmer_updates, district_updates = remap(by_farmer), remap(by_district)
+        moved = [(farmer, (merged, relocated[farmer['location']]))
+                 for farmer in farmers if farmer['location'] in relocated]
+
+        with self._lock:
+            start = self._segments.index(run[0])
+            self._segments[start:start + len(run)] = [merged]
+            for farmer, location in moved:
+                farmer['location'] = location
+            for index, updates in ((self._by_farmer, farmer_updates), (self._by_district, district_updates)):
+                for key, n, remapped in updates:
+                    remapped.extend(index[key][n:])
+                    index[key] = remapped
+
+            # Farmer records kept above may have been superseded while merging
+            for name in run:
+                self._superseded.pop(name, None)
+            stale = sum(self._farmers[farmer_id]['location'] != location for farmer_id, location in kept_farmers)
+            if stale:
+                self._superseded[merged] = stale
+
+        for name in run:
+            os.remove(os.path.join(self.log_dir, name))
+            os.remove(os.path.join(self.log_dir, name + INDEX_SUFFIX))
+        return len(run)
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            return not self._farmers and not self._by_farmer and not self._pending
+
+    def import_json(self, farmers_path: str = None, predictions_path: str = None, force: bool = False) -> Dict:
+        """
+        One-time import of the Express server's farmers.json and predictions.json
+
+        Parameters:
+        -----------
+        farmers_path, predictions_path : str, optional
+            Paths to the JSON files; default to the server data directory
+        force : bool
+            Import even if the store already holds records
+
+        Returns:
+        --------
+        dict
+            Number of farmers, crop and yield predictions imported
+        """
+        if not force and not self.is_empty():
+            raise ValueError("Prediction store already has records; pass force=True to import anyway")
+
+        farmers_path = farmers_path or os.path.join(DATA_DIR, 'farmers.json')
+        predictions_path = predictions_path or os.path.join(DATA_DIR, 'predictions.json')
+
+        counts = {'farmer': 0, 'crop': 0, 'yield': 0}
+        if os.path.exists(farmers_path):
+            with open(farmers_path, 'r') as f:
+                for farmer in json.load(f):
+                    self.append('farmer', farmer, durable=False)
+                    counts['farmer'] += 1
+
+        if os.path.exists(predictions_path):
+            with open(predictions_path, 'r') as f:
+                predictions = json.load(f)
+            for record_type, key in (('crop', 'cropPredictions'), ('yield', 'yieldPredictions')):
+                for prediction in predictions.get(key, []):
+                    self.append(record_type, prediction, durable=False)
+                    counts[record_type] += 1
+
+        self.flush()
+        return counts
+
+    def close(self):
+        """Flush pending appends and stop background threads"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join()
+
+        if self._compactor is not None:
+            self._stop_compactor.set()
+            self._compactor.join()
+
+        with self._lock:
+            self._active.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+Response Serialization
+Compact JSON and length-prefixed MessagePack encoding for inference results
+"""
+
+import json
+import struct
+import numpy as np
+from typing import Any, Dict
+
+# Decimal places kept for floats in JSON responses
+DEFAULT_PRECISION = 6
+
+# Wire formats accepted by encode_response
+RESPONSE_FORMATS = ('json', 'msgpack')
+
+def to_builtin(obj: Any, precision: int = None) -> Any:
+    """
+    Convert results holding NumPy scalars and arrays into JSON-ready values
+
+    Arrays are rounded and converted in one vectorized step rather than value
+    by value. NaN and infinite floats become None.
+    """
+    if isinstance(obj, dict):
+        return {str(key): to_builtin(value, precision) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [to_builtin(value, precision) for value in obj]
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.kind != 'f':
+            return obj.tolist()
+        if precision is not None:
+            # Rounding in float32 would land back on the nearest float32, e.g. 0.30000001192092896
+            obj = np.round(obj.astype(np.float64), precision)
+        finite = np.isfinite(obj)
+        if not finite.all():
+            obj = obj.astype(object)
+            obj[~finite] = None
+        return obj.tolist()
+    if isinstance(obj, (float, np.floating)):
+        obj = float(obj)
+        if obj != obj or obj in (float('inf'), float('-inf')):
+            return None
+        return round(obj, precision) if precision is not None else obj
+    if isinstance(obj, np.generic):
+        return obj.item()
+    return obj
+
+def dumps_json(obj: Any, precision: int = DEFAULT_PRECISION) -> str:
+    """Serialize to compact JSON with floats rounded to a fixed precision"""
+    return json.dumps(to_builtin(obj, precision), separators=(',', ':'), ensure_ascii=False)
+
+def columnar(columns: Dict[str, Any]) -> Dict:
+    """
+    Shape a batch result as one array per field instead of one dict per row
+
+    Parameters:
+    -----------
+    columns : dict
+        Field name to array or list; every column must have the same length
+
+    Returns:
+    --------
+    dict
+        {'count': n, 'columns': columns}
+    """
+    lengths = {name: len(values) for name, values in columns.items()}
+    if len(set(lengths.values())) > 1:
+        raise ValueError(f"Batch columns must have the same length, got {lengths}")
+    count = next(iter(lengths.values()), 0)
+    return {'count': count, 'columns': columns}
+
+def _pack_length(out: bytearray, n: int, fix_marker: int, fix_limit: int, markers: tuple):
+    """Write a MessagePack str/bin/array/map header"""
+    if fix_marker is not None and n < fix_limit:
+        out.append(fix_marker | n)
+    elif n < 0x100 and markers[0] is not None:
+        out += struct.pack('>BB', markers[0], n)
+    elif n < 0x10000:
+        out += struct.pack('>BH', markers[1], n)
+    else:
+        out += struct.pack('>BI', markers[2], n)
+
+def _pack_int(out: bytearray, value: int):
+    if 0 <= value < 0x80:
+        out.append(value)
+    elif -32 <= value < 0:
+        out.append(value & 0xff)
+    elif 0 <= value < 0x100:
+        out += struct.pack('>BB', 0xcc, value)
+    elif 0 <= value < 0x10000:
+        out += struct.pack('>BH', 0xcd, value)
+    elif 0 <= value < 0x100000000:
+        out += struct.pack('>BI', 0xce, value)
+    elif value >= 0:
+        out += struct.pack('>BQ', 0xcf, value)
+    elif value >= -0x80000000:
+        out += struct.pack('>Bi', 0xd2, value)
+    else:
+        out += struct.pack('>Bq', 0xd3, value)
+
+def _pack_str(out: bytearray, value: str):
+    data = value.encode('utf-8')
+    _pack_length(out, len(data), 0xa0, 32, (0xd9, 0xda, 0xdb))
+    out += data
+
+def _pack_numeric_array(out: bytearray, values: np.ndarray):
+    """Pack a 1-D numeric array with one vectorized conversion, no per-value Python work"""
+    n = values.shape[0]
+    _pack_length(out, n, 0x90, 16, (None, 0xdc, 0xdd))
+    if n == 0:
+        return
+
+    if values.dtype.kind == 'b':
+        out += np.where(values, 0xc3, 0xc2).astype(np.uint8).tobytes()
+        return
+
+    if values.dtype.kind == 'f':
+        marker, dtype = (0xca, '>f4') if values.dtype.itemsize <= 4 else (0xcb, '>f8')
+    else:
+        low, high = int(values.min()), int(values.max())
+        if 0 <= low and high < 0x80:
+            # Positive fixints are a single byte each
+            out += values.astype(np.uint8).tobytes()
+            return
+        if -0x80000000 <= low and high < 0x80000000:
+            marker, dtype = 0xd2, '>i4'
+        elif low >= 0:
+            marker, dtype = 0xcf, '>u8'
+        else:
+            marker, dtype = 0xd3, '>i8'
+
+    packed = np.empty(n, dtype=[('marker', 'u1'), ('value', dtype)])
+    packed['marker'] = marker
+    packed['value'] = values
+    out += packed.tobytes()
+
+def _pack(out: bytearray, obj: Any):
+    if obj is None:
+        out.append(0xc0)
+    elif isinstance(obj, (bool, np.bool_)):
+        out.append(0xc3 if obj else 0xc2)
+    elif isinstance(obj, (int, np.integer)):
+        _pack_int(out, int(obj))
+    elif isinstance(obj, (float, np.floating)):
+        out += struct.pack('>Bd', 0xcb, float(obj))
+    elif isinstance(obj, str):
+        _pack_str(out, obj)
+    elif isinstance(obj, (bytes, bytearray)):
+        _pack_length(out, len(obj), None, 0, (0xc4, 0xc5, 0xc6))
+        out += obj
+    elif isinstance(obj, dict):
+        _pack_length(out, len(obj), 0x80, 16, (None, 0xde, 0xdf))
+        for key, value in obj.items():
+            _pack_str(out, str(key))
+            _pack(out, value)
+    elif isinstance(obj, np.ndarray):
+        if obj.ndim == 1 and obj.dtype.kind in 'biuf':
+            _pack_numeric_array(out, obj)
+        else:
+            _pack(out, list(obj) if obj.ndim > 1 else obj.tolist())
+    elif isinstance(obj, (list, tuple)):
+        _pack_length(out, len(obj), 0x90, 16, (None, 0xdc, 0xdd))
+        for value in obj:
+            _pack(out, value)
+    elif isinstance(obj, np.generic):
+        _pack(out, obj.item())
+    else:
+        raise TypeError(f"Cannot serialize {type(obj).__name__} to MessagePack")
+
+def packb(obj: Any) -> bytes:
+    """Serialize to MessagePack, writing NumPy arrays straight from their buffers"""
+    out = bytearray()
+    _pack(out, obj)
+    return bytes(out)
+
+def frame(payload: bytes) -> bytes:
+    """Prefix a payload with its length as a 4-byte big-endian integer"""
+    return struct.pack('>I', len(payload)) + payload
+
+def read_frame(stream) -> bytes:
+    """Read one length-prefixed payload from a binary stream, or b'' at end of stream"""
+    header = stream.read(4)
+    if len(header) < 4:
+        return b''
+    (length,) = struct.unpack('>I', header)
+    return stream.read(length)
+
+def encode_response(obj: Any, fmt: str = 'json', precision: int = DEFAULT_PRECISION) -> bytes:
+    """
+    Encode a response for the wire
+
+    Parameters:
+    -----------
+    obj : any
+        Result dict, possibly holding NumPy scalars and arrays
+    fmt : str
+        'json' for compact JSON, 'msgpack' for a length-prefixed MessagePack frame
+    precision : int
+        Decimal places kept for floats in JSON
+    """
+    if fmt == 'json':
+        return dumps_json(obj, precision).encode('utf-8')
+    if fmt == 'msgpack':
+        return frame(packb(obj))
+    raise ValueError(f"Response format must be one of {RESPONSE_FORMATS}, got {fmt}")
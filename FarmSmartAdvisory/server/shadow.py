@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Shadow Scoring
+Scores a candidate model on sampled live requests, off the request path
+"""
+
+import queue
+import random
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+def default_disagreement(primary: Dict, candidate: Dict, tolerance: float = 0.05) -> bool:
+    """
+    Whether two prediction results disagree
+
+    Crop recommendations disagree when the predicted crops differ; yield
+    predictions when production differs by more than tolerance, relatively.
+    """
+    if 'predicted_crop' in primary:
+        return str(primary['predicted_crop']) != str(candidate.get('predicted_crop'))
+
+    expected = float(primary['predicted_production'])
+    actual = float(candidate['predicted_production'])
+    return abs(actual - expected) > tolerance * max(abs(expected), 1e-9)
+
+class ShadowScorer:
+    """
+    Runs a candidate predictor beside the primary one without slowing it down
+
+    The primary predictor hands each sampled request to submit() once its own
+    answer is ready. submit() only does a non-blocking put on a bounded queue,
+    dropping the request when the queue is full, so the primary call never
+    waits on the candidate. A background thread scores queued requests with
+    the candidate and records disagreement and latency deltas.
+    """
+
+    def __init__(self, candidate, sample_rate: float = 0.1, max_queue: int = 256,
+                 disagreement: Callable[[Dict, Dict], bool] = None, max_examples: int = 20):
+        """
+        Parameters:
+        -----------
+        candidate : predictor
+            Object with the same predict signature as the primary predictor
+        sample_rate : float
+            Share of primary requests to shadow
+        max_queue : int
+            Queued requests kept before new ones are dropped
+        disagreement : callable, optional
+            (primary_result, candidate_result) -> bool; defaults to default_disagreement
+        max_examples : int
+            Most recent disagreeing requests kept for inspection
+        """
+        self.candidate = candidate
+        self.sample_rate = sample_rate
+        self.disagreement = disagreement or default_disagreement
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._examples = deque(maxlen=max_examples)
+
+        self.submitted = 0
+        self.sampled = 0
+        self.dropped = 0
+        self.scored = 0
+        self.errors = 0
+        self.disagreements = 0
+        self.primary_latency = 0.0
+        self.candidate_latency = 0.0
+
+        self._worker = threading.Thread(target=self._run, name='shadow-scorer', daemon=True)
+        self._worker.start()
+
+    def submit(self, args: tuple, kwargs: Optional[Dict], primary_result: Dict, primary_latency: float) -> bool:
+        """
+        Offer a finished primary request for shadow scoring
+
+        Returns:
+        --------
+        bool
+            True if the request was queued, False if it was not sampled or dropped
+        """
+        sampled = random.random() < self.sample_rate
+        queued = False
+        if sampled:
+            try:
+                self._queue.put_nowait((args, kwargs or {}, primary_result, primary_latency))
+                queued = True
+            except queue.Full:
+                pass
+
+        with self._lock:
+            self.submitted += 1
+            if sampled:
+                self.sampled += 1
+                self.dropped += not queued
+        return queued
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            args, kwargs, primary_result, primary_latency = item
+
+            start = time.perf_counter()
+            try:
+                candidate_result = self.candidate.predict(*args, **kwargs)
+                latency = time.perf_counter() - start
+                disagrees = self.disagreement(primary_result, candidate_result)
+            except Exception as e:
+                # A failing candidate or comparison is recorded; the worker keeps running
+                with self._lock:
+                    self.errors += 1
+                self._examples.append({'input': args, 'error': f"{type(e).__name__}: {e}"})
+                continue
+
+            with self._lock:
+                self.scored += 1
+                self.disagreements += disagrees
+                self.primary_latency += primary_latency
+                self.candidate_latency += latency
+            if disagrees:
+                self._examples.append({'input': args, 'primary': primary_result, 'candidate': candidate_result})
+
+    def stats(self) -> Dict:
+        """Disagreement and latency comparison between candidate and primary"""
+        with self._lock:
+            scored = self.scored
+            primary_ms = self.primary_latency / scored * 1000 if scored else None
+            candidate_ms = self.candidate_latency / scored * 1000 if scored else None
+            return {
+                'submitted': self.submitted,
+                'sampled': self.sampled,
+                'dropped': self.dropped,
+                'queued': self._queue.qsize(),
+                'scored': scored,
+                'errors': self.errors,
+                'disagreements': self.disagreements,
+                'disagreement_rate': self.disagreements / scored if scored else None,
+                'mean_primary_latency_ms': primary_ms,
+                'mean_candidate_latency_ms': candidate_ms,
+                'mean_latency_delta_ms': candidate_ms - primary_ms if scored else None
+            }
+
+    def examples(self):
+        """Recent requests where the candidate disagreed or failed"""
+        return list(self._examples)
+
+    def close(self, timeout: float = None):
+        """Stop the worker once it has scored what is already queued"""
+        self._queue.put(None)
+        self._worker.join(timeout)
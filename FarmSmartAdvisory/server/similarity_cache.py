@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Similarity Answer Cache
+Nearest-neighbour lookup of past crop predictions over normalized soil vectors
+"""
+
+import json
+import random
+import threading
+import numpy as np
+from scipy.spatial import cKDTree
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from crop_model_inference import FEATURE_NAMES, FEATURE_RANGES
+
+# Rows per storage chunk; chunks are never reallocated, so indexing can read them unlocked
+CHUNK_ROWS = 4096
+
+class SoilAnswerCache:
+    """
+    Answers crop requests from the nearest past prediction
+
+    Soil vectors are scaled to [0, 1] by the model's feature ranges. Answers
+    live in a KD-tree plus a small unindexed buffer of recent additions,
+    which lookups scan directly. Once the buffer outgrows the square root of
+    the indexed count, the tree is rebuilt on a background thread and swapped
+    in, so adding never waits on a rebuild while lookups stay logarithmic.
+
+    A lookup hits when the nearest stored vector lies within radius. A
+    verify_fraction of hits is also scored fresh so the cache can report how
+    often its answers agree with the model.
+    """
+
+    def __init__(self, radius: float = 0.02, verify_fraction: float = 0.05,
+                 feature_ranges: Dict[str, tuple] = None, min_buffer: int = 64):
+        """
+        Parameters:
+        -----------
+        radius : float
+            Largest normalized Euclidean distance that counts as a hit
+        verify_fraction : float
+            Share of hits to check against fresh inference
+        feature_ranges : dict, optional
+            Feature name to (low, high) range used for scaling
+        min_buffer : int
+            Buffer size below which the tree is never rebuilt
+        """
+        self.radius = radius
+        self.verify_fraction = verify_fraction
+        self.min_buffer = min_buffer
+
+        ranges = feature_ranges or FEATURE_RANGES
+        bounds = np.array([ranges[f] for f in FEATURE_NAMES], dtype=np.float64)
+        self._offset = bounds[:, 0]
+        self._scale = 1.0 / (bounds[:, 1] - bounds[:, 0])
+
+        self._answers: List[Dict] = []
+        self._tree: Optional[cKDTree] = None
+        self._indexed = 0
+        self._chunks: List[np.ndarray] = []
+        self._buffer = np.empty((min_buffer, len(FEATURE_NAMES)))
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._rebuild_lock = threading.Lock()
+        self._rebuilding = False
+
+        self.lookups = 0
+        self.hits = 0
+        self.verified = 0
+        self.agreed = 0
+
+    def __len__(self) -> int:
+        return len(self._answers)
+
+    def _normalize(self, features: Sequence[float]) -> np.ndarray:
+        return (np.asarray(features, dtype=np.float64) - self._offset) * self._scale
+
+    def add(self, features: Sequence[float], answer: Dict):
+        """Store the answer given for a soil vector in model feature order"""
+        point = self._normalize(features)
+        with self._lock:
+            count = len(self._answers)
+            if count % CHUNK_ROWS == 0:
+                self._chunks.append(np.empty((CHUNK_ROWS, len(FEATURE_NAMES))))
+            self._chunks[-1][count % CHUNK_ROWS] = point
+            self._answers.append(answer)
+
+            if self._buffered == len(self._buffer):
+                self._buffer = np.vstack([self._buffer, np.empty_like(self._buffer)])
+            self._buffer[self._buffered] = point
+            self._buffered += 1
+
+            start = not self._rebuilding and self._needs_rebuild()
+            if start:
+                self._rebuilding = True
+
+        if start:
+            threading.Thread(target=self._rebuild_in_background, name='soil-cache-index', daemon=True).start()
+
+    def _needs_rebuild(self) -> bool:
+        """Whether the unindexed buffer has outgrown the tree; callers hold the lock"""
+        return self._buffered >= max(self.min_buffer, int(np.sqrt(self._indexed)))
+
+    def _rebuild_in_background(self):
+        try:
+            while True:
+                self.build_index()
+                # Answers added during the rebuild may already call for the next one
+                with self._lock:
+                    if not self._needs_rebuild():
+                        self._rebuilding = False
+                        return
+        except Exception:
+            with self._lock:
+                self._rebuilding = False
+            raise
+
+    def build_index(self):
+        """Index every answer stored so far; runs in the background on its own as answers are added"""
+        with self._rebuild_lock:
+            with self._lock:
+                count, chunks = len(self._answers), list(self._chunks)
+            if count == self._indexed:
+                return
+
+            # Rows below count are written once and never change, so the tree is built unlocked
+            tree = cKDTree(np.concatenate(chunks)[:count])
+
+            with self._lock:
+                moved = count - self._indexed
+                remaining = self._buffered - moved
+                self._buffer[:remaining] = self._buffer[moved:self._buffered].copy()
+                self._buffered = remaining
+                self._tree = tree
+                self._indexed = count
+
+    def nearest(self, features: Sequence[float], k: int = 1) -> List[Tuple[float, Dict]]:
+        """The k nearest stored answers as (distance, answer), nearest first"""
+        point = self._normalize(features)
+        with self._lock:
+            candidates = []
+            if self._tree is not None:
+                distances, indices = self._tree.query(point, k=min(k, self._indexed))
+                candidates += zip(np.atleast_1d(distances).tolist(), np.atleast_1d(indices).tolist())
+            if self._buffered:
+                distances = np.sqrt(((self._buffer[:self._buffered] - point) ** 2).sum(axis=1))
+                closest = np.argpartition(distances, k)[:k] if len(distances) > k else np.arange(len(distances))
+                candidates += zip(distances[closest].tolist(), (closest + self._indexed).tolist())
+
+            candidates.sort()
+            return [(distance, self._answers[i]) for distance, i in candidates[:k]]
+
+    def lookup(self, features: Sequence[float]) -> Optional[Tuple[float, Dict]]:
+        """
+        Find a cached answer for a soil vector
+
+        Returns:
+        --------
+        tuple or None
+            (distance, answer) of the nearest stored answer within radius
+        """
+        neighbours = self.nearest(features, 1)
+        hit = bool(neighbours) and neighbours[0][0] <= self.radius
+        with self._lock:
+            self.lookups += 1
+            self.hits += hit
+        return neighbours[0] if hit else None
+
+    def should_verify(self) -> bool:
+        """Whether a hit should also be scored fresh"""
+        return random.random() < self.verify_fraction
+
+    def record_agreement(self, cached: Dict, fresh: Dict):
+        """Compare a cached answer with fresh inference for the same request"""
+        with self._lock:
+            self.verified += 1
+            self.agreed += str(cached['predicted_crop']) == str(fresh['predicted_crop'])
+
+    def stats(self) -> Dict:
+        """Hit rate and agreement of cached answers with fresh inference"""
+        with self._lock:
+            return {
+                'size': len(self._answers),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+                'verified': self.verified,
+                'agreement_rate': self.agreed / self.verified if self.verified else None
+            }
+
+    def add_history(self, records) -> int:
+        """
+        Seed the cache from stored crop predictions
+
+        records are crop prediction records with soilData, crop, confidence
+        and alternatives, as in predictions.json or PredictionStore. Seed only
+        with history produced by the model the cache sits in front of.
+        """
+        added = 0
+        for record in records:
+            soil = record.get('soilData')
+            if not soil or any(f not in soil for f in FEATURE_NAMES):
+                continue
+            self.add([soil[f] for f in FEATURE_NAMES], {
+                'predicted_crop': record['crop'],
+                'confidence': record.get('confidence'),
+                'confidence_percentage': record['confidence'] * 100 if record.get('confidence') is not None else None,
+                'top_3_alternatives': record.get('alternatives', [])
+            })
+            added += 1
+        self.build_index()
+        return added
+
+    @classmethod
+    def from_json_file(cls, predictions_path: str, **kwargs) -> 'SoilAnswerCache':
+        """
+        Build a cache from the crop predictions in a predictions.json-style file
+
+        There is no default file: the server's data/predictions.json holds the
+        rule-based service's answers, which must not be served as another
+        model's output.
+        """
+        with open(predictions_path, 'r') as f:
+            predictions = json.load(f)
+
+        cache = cls(**kwargs)
+        cache.add_history(predictions.get('cropPredictions', []))
+        return cache
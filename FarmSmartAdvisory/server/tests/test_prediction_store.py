@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Tests for the append-only prediction store
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aggregates import ALL, PredictionAggregates
+from prediction_store import PredictionStore
+
+class PredictionStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.log_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.log_dir)
+
+    def open_store(self, **kwargs):
+        kwargs.setdefault('commit_interval', 0)
+        kwargs.setdefault('compaction_interval', 0)
+        return PredictionStore(self.log_dir, **kwargs)
+
+    def fill(self, store, farmers=3, updates=4):
+        """Farmers that change district over time, each with crop and yield predictions"""
+        for update in range(updates):
+            for i in range(farmers):
+                store.append('farmer', {'id': f'f{i}', 'phone': f'9000{i}', 'district': f'district{update}'})
+                store.append('crop', {'farmerId': f'f{i}', 'crop': 'rice', 'confidence': 0.5})
+                store.append('yield', {'farmerId': f'f{i}', 'crop': 'wheat', 'district': 'Nashik',
+                                       'area': 1, 'season': 'Rabi'})
+
+    def snapshot_queries(self, store):
+        return {
+            'farmers': [store.get_farmer(f'f{i}') for i in range(3)],
+            'by_farmer': [store.get_by_farmer(f'f{i}') for i in range(3)],
+            'by_phone': store.get_by_phone('90001'),
+            'nashik': store.get_by_district('nashik'),
+            'district0': store.get_by_district('district0')
+        }
+
+    def test_torn_tail_is_truncated_on_open(self):
+        store = self.open_store()
+        self.fill(store)
+        store.close()
+
+        active = sorted(n for n in os.listdir(self.log_dir) if n.endswith('.jsonl'))[-1]
+        path = os.path.join(self.log_dir, active)
+        size = os.path.getsize(path)
+        with open(path, 'ab') as f:
+            f.write(b'{"type":"crop","farmerId":"f0","cro')
+
+        store = self.open_store()
+        self.assertEqual(os.path.getsize(path), size)
+        self.assertEqual(len(store.get_by_farmer('f0', 'crop')), 4)
+
+        store.append('crop', {'farmerId': 'f0', 'crop': 'maize', 'confidence': 0.7})
+        self.assertEqual(store.get_by_farmer('f0', 'crop')[-1]['crop'], 'maize')
+        store.close()
+
+    def test_reopen_uses_segment_indexes_and_rescans_tail(self):
+        store = self.open_store(segment_bytes=512)
+        self.fill(store)
+        expected = self.snapshot_queries(store)
+        sealed = store._segments[:-1]
+        store.close()
+
+        self.assertTrue(sealed)
+        for name in sealed:
+            self.assertTrue(os.path.exists(os.path.join(self.log_dir, name + '.idx')))
+        store = self.open_store(segment_bytes=512)
+        self.assertEqual(self.snapshot_queries(store), expected)
+        store.close()
+
+        # A lost index file is rebuilt from its segment
+        os.remove(os.path.join(self.log_dir, sealed[0] + '.idx'))
+        store = self.open_store(segment_bytes=512)
+        self.assertEqual(self.snapshot_queries(store), expected)
+        store.close()
+        self.assertTrue(os.path.exists(os.path.join(self.log_dir, sealed[0] + '.idx')))
+
+        # A record written after the snapshot, as if the process died before close
+        active = sorted(n for n in os.listdir(self.log_dir) if n.endswith('.jsonl'))[-1]
+        with open(os.path.join(self.log_dir, active), 'ab') as f:
+            line = {'type': 'yield', 'id': 'late', 'farmerId': 'f1', 'crop': 'maize', 'district': 'Nashik'}
+            f.write((json.dumps(line, separators=(',', ':')) + '\n').encode('utf-8'))
+
+        store = self.open_store()
+        self.assertEqual(store.get_by_farmer('f1')[-1]['id'], 'late')
+        self.assertEqual(store.get_by_district('nashik')[-1]['id'], 'late')
+        store.close()
+
+    def test_compaction_remaps_index_and_drops_superseded_farmers(self):
+        store = self.open_store(segment_bytes=512)
+        self.fill(store)
+        expected = self.snapshot_queries(store)
+        sealed_before = len(store._segments) - 1
+
+        merged = store.compact(full=True)
+        self.assertEqual(merged, sealed_before)
+        self.assertEqual(self.snapshot_queries(store), expected)
+
+        farmer_ids = [r['id'] for r in store.iter_records('farmer')]
+        self.assertEqual(sorted(farmer_ids), sorted(set(farmer_ids)))
+        store.close()
+
+        store = self.open_store(segment_bytes=512)
+        self.assertEqual(self.snapshot_queries(store), expected)
+        store.close()
+
+    def test_compaction_leaves_older_tiers_alone(self):
+        store = self.open_store(segment_bytes=512, compact_min_segments=2)
+        self.fill(store, updates=6)
+        store.compact(full=True)
+        oldest = store._segments[0]
+        oldest_path = os.path.join(self.log_dir, oldest)
+        mtime = os.stat(oldest_path).st_mtime_ns
+        index_mtime = os.stat(oldest_path + '.idx').st_mtime_ns
+
+        for i in range(4):
+            store.append('crop', {'farmerId': 'f0', 'crop': 'rice', 'confidence': 0.1, 'note': 'x' * 400})
+        expected = self.snapshot_queries(store)
+
+        self.assertGreater(store.compact(), 0)
+        self.assertEqual(store._segments[0], oldest)
+        self.assertEqual(os.stat(oldest_path).st_mtime_ns, mtime)
+        self.assertEqual(self.snapshot_queries(store), expected)
+        store.close()
+        self.assertEqual(os.stat(oldest_path + '.idx').st_mtime_ns, index_mtime)
+
+    def test_append_fails_once_writer_has_died(self):
+        store = self.open_store()
+
+        def fail(batch):
+            raise OSError("disk full")
+
+        store._write_batch = fail
+        with self.assertRaises(Exception):
+            store.append('crop', {'farmerId': 'f0', 'crop': 'rice', 'confidence': 0.5})
+        with self.assertRaises(Exception):
+            store.append('crop', {'farmerId': 'f0', 'crop': 'rice', 'confidence': 0.5}, durable=False)
+        store.close()
+
+    def test_predictions_are_filed_under_farmer_district_when_written(self):
+        farmers_path = os.path.join(self.log_dir, 'farmers.json')
+        predictions_path = os.path.join(self.log_dir, 'predictions.json')
+        with open(farmers_path, 'w') as f:
+            json.dump([{'id': 'f0', 'phone': '90000', 'district': 'Pune'}], f)
+        with open(predictions_path, 'w') as f:
+            json.dump({'cropPredictions': [{'farmerId': 'f0', 'crop': 'rice', 'confidence': 0.5}]}, f)
+
+        aggregates = PredictionAggregates()
+        store = self.open_store(aggregates=aggregates)
+        store.import_json(farmers_path, predictions_path)
+        store.append('farmer', {'id': 'f0', 'phone': '90000', 'district': 'Nashik'})
+        store.append('crop', {'farmerId': 'f0', 'crop': 'maize', 'confidence': 0.5})
+
+        self.assertEqual([r['district'] for r in store.get_by_farmer('f0')], ['pune', 'nashik'])
+        self.assertEqual(aggregates.get('pune')['recommendations'], 1)
+        self.assertEqual(aggregates.get('nashik')['recommendations'], 1)
+        self.assertEqual(aggregates.get(ALL, ALL, ALL)['recommendations'], 2)
+
+        rebuilt = PredictionAggregates()
+        rebuilt.rebuild(store.iter_records())
+        self.assertEqual(rebuilt.get('pune'), aggregates.get('pune'))
+        self.assertEqual(rebuilt.get('nashik'), aggregates.get('nashik'))
+        store.close()
+
+    def test_concurrent_compactions_are_serialized(self):
+        store = self.open_store(segment_bytes=256)
+        self.fill(store, updates=6)
+        expected = self.snapshot_queries(store)
+
+        errors = []
+
+        def compact():
+            try:
+                store.compact(full=True)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=compact) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(self.snapshot_queries(store), expected)
+        store.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Tests for JSON and MessagePack response serialization
+"""
+
+import io
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from serialization import dumps_json, encode_response, packb, read_frame, to_builtin
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+class ToBuiltinTest(unittest.TestCase):
+    def test_float32_arrays_round_to_the_decimal_value(self):
+        values = np.array([0.3, 1 / 3, 2.5e-7], dtype=np.float32)
+        self.assertEqual(to_builtin(values, 6), [0.3, 0.333333, 0.0])
+        self.assertEqual(dumps_json({'v': values}), '{"v":[0.3,0.333333,0.0]}')
+
+    def test_non_finite_values_become_none(self):
+        values = np.array([1.5, np.nan, np.inf], dtype=np.float32)
+        self.assertEqual(to_builtin(values, 6), [1.5, None, None])
+        self.assertIsNone(to_builtin(np.float64('nan')))
+
+@unittest.skipUnless(msgpack, "msgpack is not installed")
+class PackbRoundTripTest(unittest.TestCase):
+    def assertRoundTrips(self, obj, expected=None):
+        self.assertEqual(msgpack.unpackb(packb(obj), raw=False), obj if expected is None else expected)
+
+    def test_string_length_boundaries(self):
+        # fixstr holds up to 31 bytes, str8 up to 255, str16 up to 65535
+        for n in (0, 1, 31, 32, 255, 256, 65535, 65536):
+            self.assertRoundTrips('x' * n)
+        self.assertRoundTrips('फसल' * 11)
+
+    def test_container_length_boundaries(self):
+        # fixmap and fixarray hold up to 15 entries, map16 and array16 up to 65535
+        for n in (0, 15, 16, 65535, 65536):
+            self.assertRoundTrips({f'k{i}': i for i in range(n)})
+            self.assertRoundTrips(list(range(n)))
+
+    def test_integers(self):
+        for value in (0, 127, 128, 255, 256, 65535, 65536, 2 ** 32 - 1, 2 ** 32, 2 ** 64 - 1,
+                      -1, -32, -33, -128, -129, -2 ** 31, -2 ** 31 - 1, -2 ** 63):
+            self.assertRoundTrips(value)
+            self.assertRoundTrips(np.int64(value) if value < 2 ** 63 else np.uint64(value), value)
+
+    def test_scalars(self):
+        for value in (None, True, False, 0.1, -2.5, b'\x00\xff'):
+            self.assertRoundTrips(value)
+        self.assertRoundTrips(np.bool_(True), True)
+        self.assertRoundTrips(np.float32(0.5), 0.5)
+
+    def test_numeric_arrays(self):
+        arrays = [
+            np.array([], dtype=np.float64),
+            np.array([True, False, True]),
+            np.array([0, 1, 127], dtype=np.uint8),
+            np.arange(-40, 40, dtype=np.int16),
+            np.array([0, 2 ** 64 - 1], dtype=np.uint64),
+            np.array([-2 ** 63, 2 ** 40], dtype=np.int64),
+            np.linspace(0, 1, 17),
+        ]
+        for values in arrays:
+            self.assertRoundTrips(values, values.tolist())
+
+        values = np.array([0.3, -1.25, 1e30], dtype=np.float32)
+        self.assertEqual(msgpack.unpackb(packb(values)), values.astype(np.float64).tolist())
+        self.assertRoundTrips(np.arange(6).reshape(2, 3), [[0, 1, 2], [3, 4, 5]])
+
+    def test_framed_response(self):
+        result = {'predicted_crop': 'rice', 'probabilities': np.array([0.25, 0.75]), 'count': np.int64(2)}
+        payload = read_frame(io.BytesIO(encode_response(result, 'msgpack')))
+        self.assertEqual(msgpack.unpackb(payload, raw=False),
+                         {'predicted_crop': 'rice', 'probabilities': [0.25, 0.75], 'count': 2})
+
+if __name__ == '__main__':
+    unittest.main()
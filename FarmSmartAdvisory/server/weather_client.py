@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+Weather Client
+Async weather lookups with grid-snapped caching and request coalescing
+"""
+
+import asyncio
+import http.client
+import json
+import math
+import os
+import queue
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Sequence, Tuple
+from urllib.parse import urlencode, urlsplit
+
+# Same fallback the Express server uses when the weather API is unavailable
+DEFAULT_WEATHER = {'temperature': 28, 'humidity': 65, 'rainfall': 450}
+
+class WeatherBackend:
+    """Base class for weather sources"""
+
+    async def fetch(self, lat: float, lon: float) -> Dict:
+        """Return temperature, humidity and rainfall for a coordinate"""
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+class OpenWeatherMapBackend(WeatherBackend):
+    """
+    OpenWeatherMap current-weather backend
+
+    Requests go through a pool of keep-alive connections served by a thread
+    pool of the same size. Point base_url at a local HTTP stub that mimics the
+    OpenWeatherMap response to run without network access.
+    """
+
+    def __init__(self, api_key: str = None, base_url: str = 'https://api.openweathermap.org',
+                 max_connections: int = 8, timeout: float = 5.0):
+        self.api_key = api_key or os.environ.get('OPENWEATHER_API_KEY') or os.environ.get('WEATHER_API_KEY')
+        if not self.api_key:
+            raise ValueError("OpenWeatherMap backend needs an API key")
+
+        url = urlsplit(base_url)
+        self._scheme = url.scheme
+        self._host = url.netloc
+        self._path = url.path.rstrip('/') + '/data/2.5/weather'
+        self._timeout = timeout
+
+        self._connections = queue.LifoQueue(maxsize=max_connections)
+        self._executor = ThreadPoolExecutor(max_workers=max_connections, thread_name_prefix='weather')
+
+    def _new_connection(self) -> http.client.HTTPConnection:
+        if self._scheme == 'https':
+            return http.client.HTTPSConnection(self._host, timeout=self._timeout)
+        return http.client.HTTPConnection(self._host, timeout=self._timeout)
+
+    def _request(self, connection: http.client.HTTPConnection, url: str) -> bytes:
+        try:
+            connection.request('GET', url)
+            response = connection.getresponse()
+            body = response.read()
+            if response.status != 200:
+                raise Exception(f"Weather API returned status {response.status}")
+        except Exception:
+            connection.close()
+            raise
+        return body
+
+    def _fetch_sync(self, lat: float, lon: float) -> Dict:
+        try:
+            connection = self._connections.get_nowait()
+            reused = True
+        except queue.Empty:
+            connection = self._new_connection()
+            reused = False
+
+        query = urlencode({'lat': lat, 'lon': lon, 'appid': self.api_key, 'units': 'metric'})
+        url = f'{self._path}?{query}'
+        try:
+            body = self._request(connection, url)
+        except (http.client.RemoteDisconnected, ConnectionError):
+            if not reused:
+                raise
+            # The server closed the pooled connection while it sat idle; retry once on a fresh one
+            connection = self._new_connection()
+            body = self._request(connection, url)
+
+        # Only connections that completed a request cleanly go back to the pool
+        try:
+            self._connections.put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+        data = json.loads(body)
+        return {
+            'temperature': data['main']['temp'],
+            'humidity': data['main']['humidity'],
+            'rainfall': data.get('rain', {}).get('1h', 0)
+        }
+
+    async def fetch(self, lat: float, lon: float) -> Dict:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._fetch_sync, lat, lon)
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+        while not self._connections.empty():
+            self._connections.get_nowait().close()
+
+class FileStubBackend(WeatherBackend):
+    """
+    Offline backend that serves weather from a local JSON file
+
+    The file holds a list of {"lat", "lon", "temperature", "humidity",
+    "rainfall"} entries; lookups return the nearest entry, or the default
+    weather when the file has none.
+    """
+
+    def __init__(self, path: str = None, latency: float = 0.0):
+        self.latency = latency
+        self.entries = []
+        if path and os.path.exists(path):
+            with open(path, 'r') as f:
+                self.entries = json.load(f)
+
+    async def fetch(self, lat: float, lon: float) -> Dict:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if not self.entries:
+            return dict(DEFAULT_WEATHER)
+
+        nearest = min(self.entries, key=lambda e: (e['lat'] - lat) ** 2 + (e['lon'] - lon) ** 2)
+        return {key: nearest[key] for key in DEFAULT_WEATHER}
+
+class WeatherClient:
+    """
+    Caching, request-coalescing weather client
+
+    Coordinates are snapped to a grid of cell_size degrees and each cell is
+    cached for ttl seconds. Concurrent lookups for the same cell share one
+    backend fetch, and at most max_concurrency fetches run at a time. When a
+    fetch fails the default weather is cached for failure_ttl seconds, so an
+    outage costs one backend timeout per cell rather than one per lookup.
+    """
+
+    def __init__(self, backend: WeatherBackend = None, cell_size: float = 0.1,
+                 ttl: float = 900.0, max_concurrency: int = 8, max_entries: int = 10000,
+                 failure_ttl: float = 60.0):
+        self.backend = backend or FileStubBackend()
+        self.cell_size = cell_size
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.max_entries = max_entries
+
+        self._cache: 'OrderedDict[Tuple[int, int], Tuple[float, Dict]]' = OrderedDict()
+        self._in_flight: Dict[Tuple[int, int], asyncio.Future] = {}
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.errors = 0
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.cell_size), math.floor(lon / self.cell_size))
+
+    def _cell_center(self, cell: Tuple[int, int]) -> Tuple[float, float]:
+        return ((cell[0] + 0.5) * self.cell_size, (cell[1] + 0.5) * self.cell_size)
+
+    async def get(self, lat: float, lon: float) -> Dict:
+        """Get weather for a coordinate"""
+        cell = self._cell(lat, lon)
+
+        cached = self._cache.get(cell)
+        if cached is not None:
+            expires, weather = cached
+            if expires > time.monotonic():
+                self._cache.move_to_end(cell)
+                self.hits += 1
+                return dict(weather)
+            del self._cache[cell]
+
+        future = self._in_flight.get(cell)
+        if future is not None:
+            self.coalesced += 1
+            weather = await asyncio.shield(future)
+            if weather is None:
+                # The task running the fetch was cancelled; look the cell up afresh
+                return await self.get(lat, lon)
+            return dict(weather)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[cell] = future
+        try:
+            weather = await self._fetch(cell)
+            future.set_result(weather)
+        finally:
+            del self._in_flight[cell]
+            if not future.done():
+                future.set_result(None)
+        return dict(weather)
+
+    async def _fetch(self, cell: Tuple[int, int]) -> Dict:
+        lat, lon = self._cell_center(cell)
+        try:
+            async with self._semaphore:
+                weather = await self.backend.fetch(lat, lon)
+        except Exception as e:
+            # Failed lookups fall back to the default, cached briefly
+            print(f"Weather lookup failed: {str(e)}")
+            self.errors += 1
+            weather, ttl = dict(DEFAULT_WEATHER), self.failure_ttl
+        else:
+            ttl = self.ttl
+
+        self._cache[cell] = (time.monotonic() + ttl, weather)
+        if len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return weather
+
+    async def get_many(self, coords: Sequence[Tuple[float, float]]) -> List[Dict]:
+        """Get weather for many coordinates concurrently, in input order"""
+        return await asyncio.gather(*(self.get(lat, lon) for lat, lon in coords))
+
+    def stats(self) -> Dict:
+        """Cache and coalescing counters"""
+        lookups = self.hits + self.misses + self.coalesced
+        return {
+            'lookups': lookups,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'hit_rate': (self.hits + self.coalesced) / lookups if lookups else 0.0,
+            'cached_cells': len(self._cache)
+        }
+
+    async def close(self):
+        await self.backend.close()